@@ -0,0 +1,31 @@
+from gdpr import anonymizers
+
+from .models import BenchCustomer, BenchEvent, BenchLog
+
+
+class BenchCustomerAnonymizer(anonymizers.ModelAnonymizer):
+
+    first_name = anonymizers.NameFieldAnonymizer()
+    last_name = anonymizers.NameFieldAnonymizer(cache=1000)
+    email = anonymizers.EmailFieldAnonymizer()
+    phone = anonymizers.PhoneFieldAnonymizer()
+    personal_id = anonymizers.PersonalIIDFieldAnonymizer()
+    note = anonymizers.MD5TextFieldAnonymizer()
+
+    class Meta:
+        model = BenchCustomer
+
+
+class BenchEventAnonymizer(anonymizers.ModelAnonymizer):
+
+    email = anonymizers.EmailFieldAnonymizer()
+    note = anonymizers.StaticValueAnonymizer('')
+
+    class Meta:
+        model = BenchEvent
+
+
+class BenchLogAnonymizer(anonymizers.DeleteModelAnonymizer):
+
+    class Meta:
+        model = BenchLog
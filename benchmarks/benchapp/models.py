@@ -0,0 +1,25 @@
+from django.db import models
+
+
+class BenchCustomer(models.Model):
+
+    first_name = models.CharField(max_length=100)
+    last_name = models.CharField(max_length=100)
+    email = models.EmailField()
+    phone = models.CharField(max_length=20)
+    personal_id = models.CharField(max_length=10)
+    note = models.TextField(blank=True)
+    avatar = models.FileField(blank=True)
+
+
+class BenchEvent(models.Model):
+
+    customer = models.ForeignKey(BenchCustomer, related_name='events', on_delete=models.CASCADE)
+    email = models.EmailField()
+    note = models.TextField(blank=True)
+
+
+class BenchLog(models.Model):
+
+    event = models.ForeignKey(BenchEvent, related_name='logs', on_delete=models.CASCADE)
+    text = models.TextField(blank=True)
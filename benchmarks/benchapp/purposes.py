@@ -0,0 +1,14 @@
+from datetime import timedelta
+
+from gdpr.purposes.default import AbstractPurpose
+
+
+class BenchMarketingPurpose(AbstractPurpose):
+
+    name = 'Benchmark marketing'
+    slug = 'bench-marketing'
+    expiration_timedelta = timedelta(days=365)
+    fields = {
+        'benchapp.BenchCustomer': ('first_name', 'last_name', 'email'),
+        'benchapp.BenchEvent': ('email',),
+    }
@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+"""
+Benchmark suite of django-GDPR. It measures field anonymizers (micro-benchmarks), consent manager throughput and
+end-to-end anonymize_data command speed on synthetic tables. Results are written as JSON to be compared across
+versions.
+
+Usage:
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --database postgresql --sizes 10000,1000000,10000000 --output results.json
+
+SQLite database is created in a temporary directory. PostgreSQL connection is configured with the standard
+PGHOST, PGPORT, PGUSER, PGPASSWORD and PGDATABASE environment variables, the test database (test_<PGDATABASE>) is
+created and destroyed by the runner.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+from datetime import datetime
+from io import StringIO
+
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_database_settings(database, tmp_dir):
+    if database == 'postgresql':
+        return {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('PGDATABASE', 'gdpr_benchmarks'),
+            'USER': os.environ.get('PGUSER', ''),
+            'PASSWORD': os.environ.get('PGPASSWORD', ''),
+            'HOST': os.environ.get('PGHOST', ''),
+            'PORT': os.environ.get('PGPORT', ''),
+        }
+    else:
+        return {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.path.join(tmp_dir, 'benchmarks.sqlite3'),
+            'TEST': {'NAME': os.path.join(tmp_dir, 'test_benchmarks.sqlite3')},
+        }
+
+
+def setup_django(database, tmp_dir):
+    sys.path.insert(0, BENCHMARKS_DIR)
+
+    import django
+    from django.conf import settings
+
+    settings.configure(
+        SECRET_KEY='benchmarks',
+        INSTALLED_APPS=['django.contrib.contenttypes', 'gdpr', 'benchapp'],
+        DATABASES={'default': get_database_settings(database, tmp_dir)},
+        USE_TZ=True,
+        USE_I18N=False,
+        MEDIA_ROOT=os.path.join(tmp_dir, 'media'),
+        ANONYMIZATION_LOADERS=[('benchapp.anonymizers',)],
+        ANONYMIZATION_NAME_KEY='3141592653',
+        ANONYMIZATION_PHONE_KEY=123456789,
+        ANONYMIZATION_PERSONAL_ID_KEY=1234,
+        ANONYMIZATION_PATH=os.path.join(BENCHMARKS_DIR, 'benchapp', 'files'),
+    )
+    django.setup()
+
+    import benchapp.purposes  # noqa: F401 purposes are registered by import
+
+
+def measure(name, function, iterations, **extra):
+    """
+    Run function once and return benchmark result with throughput of the iterations.
+    """
+    start = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - start
+    result = {
+        'benchmark': name,
+        'iterations': iterations,
+        'seconds': round(seconds, 6),
+        'per_second': round(iterations / seconds, 2) if seconds else None,
+    }
+    result.update(extra)
+    print('{benchmark}: {iterations} iterations, {seconds:.3f} s, {per_second} per second'.format(**result))
+    return result
+
+
+def get_customer_values(i):
+    return {
+        'first_name': 'Jan{}'.format(i % 1000),
+        'last_name': 'Novák',
+        'email': 'customer{}@example.com'.format(i),
+        'phone': '+420{:09d}'.format(777000000 + i % 1000000),
+        'personal_id': '800101{:04d}'.format(i % 10000),
+        'note': 'Customer note {}'.format(i) if i % 3 else '',
+    }
+
+
+def get_field_anonymizer_samples(count):
+    from django.db.models.fields.files import FieldFile
+
+    from gdpr import anonymizers
+
+    from benchapp.models import BenchCustomer
+
+    customers = [get_customer_values(i) for i in range(count)]
+    avatar_field = BenchCustomer._meta.get_field('avatar')
+    return [
+        (anonymizers.NameFieldAnonymizer(), [customer['first_name'] for customer in customers]),
+        (anonymizers.EmailFieldAnonymizer(), [customer['email'] for customer in customers]),
+        (anonymizers.UsernameFieldAnonymizer(), ['1:{}'.format(customer['email']) for customer in customers]),
+        (anonymizers.PhoneFieldAnonymizer(), [customer['phone'] for customer in customers]),
+        (anonymizers.PersonalIIDFieldAnonymizer(), [customer['personal_id'] for customer in customers]),
+        (anonymizers.IDCardDataFieldAnonymizer(), ['{:09d}'.format(i) for i in range(count)]),
+        (anonymizers.MD5TextFieldAnonymizer(), [customer['note'] for customer in customers]),
+        (anonymizers.StaticValueAnonymizer('anonymized'), [customer['note'] for customer in customers]),
+        (
+            anonymizers.DummyFileAnonymizer('dummy.txt', shared=True),
+            [FieldFile(None, avatar_field, 'avatar{}.txt'.format(i)) for i in range(count)]
+        ),
+    ]
+
+
+def benchmark_field_anonymizers(count):
+    results = []
+    for anonymizer, values in get_field_anonymizer_samples(count):
+        name = 'field_anonymizer.{}'.format(anonymizer.__class__.__name__)
+        results.append(measure(
+            '{}.single'.format(name), lambda: [anonymizer.get_anonymized_value(value) for value in values], count
+        ))
+        results.append(measure('{}.batch'.format(name), lambda: anonymizer.get_anonymized_values(values), count))
+    return results
+
+
+def create_customers(count, batch_size=10000):
+    from benchapp.models import BenchCustomer
+
+    for i in range(0, count, batch_size):
+        BenchCustomer.objects.bulk_create(
+            [BenchCustomer(**get_customer_values(j)) for j in range(i, min(i + batch_size, count))]
+        )
+
+
+def create_events(count, batch_size=10000):
+    from benchapp.models import BenchCustomer, BenchEvent, BenchLog
+
+    customer_ids = list(BenchCustomer.objects.order_by('pk').values_list('pk', flat=True)[:count])
+    for i in range(0, count, batch_size):
+        BenchEvent.objects.bulk_create([
+            BenchEvent(customer_id=customer_ids[j % len(customer_ids)], email='event{}@example.com'.format(j),
+                       note='Event note')
+            for j in range(i, min(i + batch_size, count))
+        ])
+    event_ids = list(BenchEvent.objects.order_by('pk').values_list('pk', flat=True))
+    for i in range(0, len(event_ids), batch_size):
+        BenchLog.objects.bulk_create([
+            BenchLog(event_id=event_id, text='Log') for event_id in event_ids[i:i + batch_size]
+        ])
+
+
+def clear_data():
+    from gdpr.models import AnonymizationCheckpoint, AnonymizedData, LegalReason, LegalReasonRelatedObject
+
+    from benchapp.models import BenchCustomer, BenchEvent, BenchLog
+
+    for model in (AnonymizedData, AnonymizationCheckpoint, LegalReasonRelatedObject, LegalReason, BenchLog, BenchEvent,
+                  BenchCustomer):
+        model.objects.all()._raw_delete(model.objects.db)
+
+
+def benchmark_consents(count):
+    from django.db import connection
+
+    from gdpr.metrics import QueryCounter
+    from gdpr.models import LegalReason
+
+    from benchapp.models import BenchCustomer
+
+    clear_data()
+    create_customers(count)
+    customers = list(BenchCustomer.objects.order_by('pk'))
+    results = []
+
+    def run_counted(name, function):
+        with QueryCounter(connection) as counter:
+            result = measure(name, function, count)
+        result['queries'] = counter.count
+        results.append(result)
+
+    run_counted('consents.create_consent', lambda: [
+        LegalReason.objects.create_consent('bench-marketing', customer) for customer in customers
+    ])
+    run_counted('consents.exists_valid_consent', lambda: [
+        LegalReason.objects.exists_valid_consent('bench-marketing', customer) for customer in customers
+    ])
+    clear_data()
+    create_customers(count)
+    customers = list(BenchCustomer.objects.order_by('pk'))
+    run_counted('consents.create_consents', lambda: LegalReason.objects.create_consents('bench-marketing', customers))
+    run_counted('consents.exists_valid_consents', lambda: LegalReason.objects.exists_valid_consents(
+        ['bench-marketing'], customers
+    ))
+    return results
+
+
+def benchmark_anonymize_data(sizes, workers):
+    from django.core.management import call_command
+    from django.db import connection
+
+    from gdpr.metrics import QueryCounter
+
+    from benchapp.models import BenchCustomer, BenchEvent, BenchLog
+
+    results = []
+    for size in sizes:
+        clear_data()
+        create_customers(size)
+        create_events(size)
+        for model in (BenchCustomer, BenchEvent, BenchLog):
+            label = '{}.{}'.format(model._meta.app_label, model._meta.model_name)
+            with QueryCounter(connection) as counter:
+                result = measure(
+                    'anonymize_data.{}.{}'.format(label, size),
+                    lambda: call_command('anonymize_data', models=label, workers=workers, stdout=StringIO()),
+                    size,
+                    rows=size,
+                    workers=workers,
+                )
+            # Queries of the worker processes are not counted
+            result['queries'] = counter.count
+            results.append(result)
+    return results
+
+
+def get_versions(database):
+    import django
+
+    from django.db import connection
+
+    from gdpr.version import get_version
+
+    return {
+        'gdpr': get_version(),
+        'django': django.get_version(),
+        'python': platform.python_version(),
+        'database': database,
+        'database_version': (
+            str(connection.pg_version) if connection.vendor == 'postgresql' else connection.Database.sqlite_version
+        ),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run django-GDPR benchmarks.')
+    parser.add_argument('--database', choices=('sqlite', 'postgresql'), default='sqlite')
+    parser.add_argument('--sizes', default='10000',
+                        help='comma separated numbers of rows of anonymize_data benchmark tables (e.g. 10000,1000000).')
+    parser.add_argument('--micro-iterations', type=int, default=100000,
+                        help='number of values anonymized by every field anonymizer.')
+    parser.add_argument('--consents', type=int, default=1000, help='number of consents of consent benchmarks.')
+    parser.add_argument('--workers', type=int, default=1, help='number of anonymize_data worker processes.')
+    parser.add_argument('--benchmarks', default='fields,consents,anonymize_data',
+                        help='comma separated benchmark groups to run.')
+    parser.add_argument('--output', help='path of the JSON results file, results are printed to stdout by default.')
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp(prefix='gdpr-benchmarks-')
+    try:
+        setup_django(args.database, tmp_dir)
+
+        from django.db import connection
+
+        # Test database is created with migrations of gdpr and synchronized tables of the benchmark app
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            benchmarks = {v.strip() for v in args.benchmarks.split(',')}
+            results = []
+            if 'fields' in benchmarks:
+                results += benchmark_field_anonymizers(args.micro_iterations)
+            if 'consents' in benchmarks:
+                results += benchmark_consents(args.consents)
+            if 'anonymize_data' in benchmarks:
+                results += benchmark_anonymize_data([int(v) for v in args.sizes.split(',')], args.workers)
+            output = {
+                'created_at': datetime.utcnow().isoformat(),
+                'versions': get_versions(args.database),
+                'results': results,
+            }
+        finally:
+            connection.creation.destroy_test_db(connection.settings_dict['NAME'], verbosity=0)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2)
+    else:
+        print(json.dumps(output, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,36 @@
 import os
+import posixpath
 
-from os.path import basename
+from os.path import basename, splitext
 
 import re
 
 import hashlib
+import time
 
+from collections import OrderedDict, defaultdict
+
+from functools import lru_cache
+
+from django.apps import apps
 from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 from django.core.files.base import ContentFile
+from django.db import connections, router, transaction
+from django.db.models import CASCADE, DO_NOTHING, SET_NULL, Case, CharField, F, FileField, Q, Value, When, signals
+from django.db.models.deletion import get_candidate_relations_to_delete
+from django.db.models.functions import Concat, Length, Lower, Substr
 
 from chamber.utils import remove_accent
 
+from .cache import LRUCache
+from .functions import MD5
+from .iterators import iterate_rows, keyset_iterator
+from .loading import register
+
+
+NAME_NORMALIZATION_RE = re.compile(r'[^A-Z ]')
+
 
 class FieldAnonymizer:
     """
@@ -19,22 +39,136 @@ class FieldAnonymizer:
 
     ignore_empty_values = True
     empty_values = [None]
-
-    def __init__(self, ignore_empty_values=None, empty_values=None):
+    # Anonymizer needs model instance attribute value (e.g. FieldFile), raw database value is not sufficient. Model
+    # instances are always used for anonymizers that override get_anonymized_value_from_obj (see
+    # is_model_instance_required)
+    requires_model_instance = False
+    # Anonymized value is a deterministic function of the original value therefore anonymized records can be searched
+    # by the anonymized original value
+    is_searchable = True
+    # Original value can be computed from the anonymized value with get_deanonymized_value
+    is_reversible = False
+
+    def __init__(self, ignore_empty_values=None, empty_values=None, cache=None):
         """
         Args:
             ignore_empty_values: defines if empty value of a model will be ignored or should be anonymized too
             empty_values: define list of values which are considered as empty
+            cache: size of the anonymizer LRU cache of anonymized values or LRUCache instance that can be shared
+                between more anonymizers (values are cached per anonymizer instance therefore differently configured
+                anonymizers don't share them), use it only for anonymizers that are pure functions of the input value
         """
         self._ignore_empty_values = ignore_empty_values if ignore_empty_values is not None else self.ignore_empty_values
         self._empty_values = empty_values if empty_values is not None else self.empty_values
+        self.cache = LRUCache(cache) if isinstance(cache, int) else cache
+
+    def _get_cached_anonymized_values(self, values):
+        anonymized_values = {}
+        missing_values = []
+        uncached_indexes = set()
+        for i, value in enumerate(values):
+            try:
+                if value in anonymized_values:
+                    self.cache.hits += 1
+                    continue
+            except TypeError:
+                # Unhashable values (e.g. dict or list of JSONField) are not cached
+                uncached_indexes.add(i)
+                continue
+
+            anonymized_values[value] = self.cache.get((self, value))
+            if anonymized_values[value] is LRUCache.missing:
+                missing_values.append(value)
+
+        computed_values = self.get_anonymized_values(missing_values + [values[i] for i in sorted(uncached_indexes)])
+        for value, anonymized_value in zip(missing_values, computed_values):
+            anonymized_values[value] = anonymized_value
+            self.cache.set((self, value), anonymized_value)
+        uncached_anonymized_values = iter(computed_values[len(missing_values):])
+        return [
+            next(uncached_anonymized_values) if i in uncached_indexes else anonymized_values[value]
+            for i, value in enumerate(values)
+        ]
+
+    def _get_anonymized_values(self, values):
+        if self.cache is None:
+            return self.get_anonymized_values(values)
+        else:
+            return self._get_cached_anonymized_values(values)
+
+    def _overrides_get_anonymized_value_from_obj(self):
+        return type(self).get_anonymized_value_from_obj is not FieldAnonymizer.get_anonymized_value_from_obj
+
+    def is_model_instance_required(self):
+        """
+        Returns:
+            True if objects must be model instances, rows with only the anonymized fields are not sufficient because
+            the anonymizer reads model instance attributes or custom get_anonymized_value_from_obj can read any of them
+        """
+        return self.requires_model_instance or self._overrides_get_anonymized_value_from_obj()
 
     def get_anonymized_value_from_obj(self, obj, name):
         value = getattr(obj, name)
         if self._ignore_empty_values and value in self._empty_values:
             return value
-        else:
+        elif self.cache is None:
             return self.get_anonymized_value(value)
+        else:
+            return self._get_cached_anonymized_values([value])[0]
+
+    def get_anonymized_values_from_objs(self, objs, name):
+        """
+        Batch variant of get_anonymized_value_from_obj. Empty values are kept and the rest is anonymized with
+        get_anonymized_values (only values missing in the cache if it is used). If the anonymizer overrides
+        get_anonymized_value_from_obj, it is called for every object instead.
+
+        Args:
+            objs: list of objects with anonymized attribute
+            name: name of the anonymized attribute
+
+        Returns:
+            list of anonymized values in the order of objs
+        """
+        if self._overrides_get_anonymized_value_from_obj():
+            return [self.get_anonymized_value_from_obj(obj, name) for obj in objs]
+
+        values = [getattr(obj, name) for obj in objs]
+        if not self._ignore_empty_values:
+            return self._get_anonymized_values(values)
+
+        non_empty_indexes = [i for i, value in enumerate(values) if value not in self._empty_values]
+        anonymized_values = list(values)
+        for i, anonymized_value in zip(non_empty_indexes,
+                                       self._get_anonymized_values([values[i] for i in non_empty_indexes])):
+            anonymized_values[i] = anonymized_value
+        return anonymized_values
+
+    def get_dumped_values_from_objs(self, objs, name):
+        """
+        Variant of get_anonymized_values_from_objs used by the anonymized dump. Dumped values must not change the
+        source database nor file storages, anonymizers with such side effects must override it.
+
+        Args:
+            objs: list of objects with anonymized attribute
+            name: name of the anonymized attribute
+
+        Returns:
+            list of anonymized values in the order of objs
+        """
+        return self.get_anonymized_values_from_objs(objs, name)
+
+    def get_anonymized_values(self, values):
+        """
+        Anonymize list of values. Default implementation calls get_anonymized_value for every value, anonymizers
+        should override it if the rule can be applied to the whole list more efficiently.
+
+        Args:
+            values: list of non empty values that are anonymized
+
+        Returns:
+            list of anonymized values
+        """
+        return [self.get_anonymized_value(value) for value in values]
 
     def get_anonymized_value(self, value):
         """
@@ -48,6 +182,82 @@ class FieldAnonymizer:
         """
         raise NotImplementedError
 
+    def get_lookup_value(self, value):
+        """
+        Returns value that is stored in the anonymized database instead of the original value, it can be used in the
+        equality query (the index of the field is used).
+
+        Args:
+            value: original value
+        """
+        if not self.is_searchable:
+            raise NotImplementedError('{} does not support lookup by original value'.format(self.__class__.__name__))
+        if self._ignore_empty_values and value in self._empty_values:
+            return value
+        return self.get_anonymized_value(value)
+
+    def get_deanonymized_value(self, value):
+        """
+        Inverse of the anonymization rule, it is implemented only by the reversible anonymizers (is_reversible).
+
+        Args:
+            value: anonymized value
+
+        Returns:
+            original value
+        """
+        raise NotImplementedError('{} is not reversible'.format(self.__class__.__name__))
+
+    def get_db_expression(self, field, connection):
+        """
+        Returns database expression that anonymizes the field directly in the database or None if the anonymization
+        cannot be performed by the connection backend. Empty values are preserved the same way as with Python
+        anonymization.
+
+        Args:
+            field: anonymized model field
+            connection: database connection where the expression will be evaluated
+        """
+        if self._overrides_get_anonymized_value_from_obj():
+            # Custom per object anonymization cannot be performed in the database
+            return None
+
+        expression = self.get_anonymized_expression(F(field.name), field, connection)
+        if expression is None or not self._ignore_empty_values:
+            return expression
+
+        cases = []
+        if None in self._empty_values:
+            cases.append(When(**{'{}__isnull'.format(field.name): True}, then=F(field.name)))
+        not_null_empty_values = [v for v in self._empty_values if v is not None]
+        if not_null_empty_values:
+            cases.append(When(**{'{}__in'.format(field.name): not_null_empty_values}, then=F(field.name)))
+        return Case(*cases, default=expression, output_field=field) if cases else expression
+
+    def get_anonymized_expression(self, expression, field, connection):
+        """
+        Anonymizer can define SQL variant of the anonymization rule, by default it is not supported.
+
+        Args:
+            expression: expression with value that is anonymized
+            field: anonymized model field
+            connection: database connection where the expression will be evaluated
+
+        Returns:
+            anonymized expression or None if it is not supported
+        """
+        return None
+
+    def post_anonymize_batch(self, objs, name):
+        """
+        Hook that is called after anonymized values of objs were successfully written to the database.
+
+        Args:
+            objs: list of objects with original values
+            name: name of the anonymized attribute
+        """
+        pass
+
 
 class MD5TextFieldAnonymizer(FieldAnonymizer):
     """
@@ -61,6 +271,11 @@ class MD5TextFieldAnonymizer(FieldAnonymizer):
     def get_anonymized_value(self, value):
         return hashlib.md5(value.encode('utf-8')).hexdigest()[:len(value)] if value else value
 
+    def get_anonymized_expression(self, expression, field, connection):
+        if not MD5.is_supported(connection):
+            return None
+        return Substr(MD5(expression), 1, Length(expression), output_field=CharField())
+
 
 class EmailFieldAnonymizer(FieldAnonymizer):
     """
@@ -76,6 +291,15 @@ class EmailFieldAnonymizer(FieldAnonymizer):
             'devnull.homecredit.net'
         )
 
+    def get_anonymized_expression(self, expression, field, connection):
+        if not MD5.is_supported(connection):
+            return None
+        return Concat(
+            Substr(MD5(Lower(expression)), 1, 8, output_field=CharField()),
+            Value('@devnull.homecredit.net'),
+            output_field=CharField()
+        )
+
 
 class UsernameFieldAnonymizer(EmailFieldAnonymizer):
     """
@@ -89,33 +313,74 @@ class UsernameFieldAnonymizer(EmailFieldAnonymizer):
         site_id, email = value.split(':', 1)
         return '{}:{}'.format(site_id, super().get_anonymized_value(email))
 
+    def get_anonymized_expression(self, expression, field, connection):
+        return None
+
 
 class NameFieldAnonymizer(FieldAnonymizer):
     """
     Anonymization of first name and last name of the customer with HC method. There is used Ceasar cipher.
     There is used only 26 characters [A-Z] and space. Chars that are not space or cannot be converted from UTF-8 to
-    the [A-Z] are replaced with char "Q".
+    the [A-Z] are replaced with char "Q". Deanonymized value is the normalized original value (upper case without
+    accents).
     """
 
     empty_values = [None, '']
+    is_reversible = True
 
+    @staticmethod
     def _char_to_number(char_value):
         return ord(char_value) - 64
 
+    @staticmethod
     def _number_to_char(int_value):
         return chr((int_value % 27) + 64)
 
+    @classmethod
+    @lru_cache()
+    def _get_translation_tables(cls, key):
+        """
+        Returns translation table for every position of the key. Char on the position i of the normalized value is
+        translated with the table on the position i % len(key).
+        """
+        return [
+            {
+                ord(char): cls._number_to_char(cls._char_to_number(char) + int(k))
+                for char in 'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+            }
+            for k in key
+        ]
+
+    @classmethod
+    @lru_cache()
+    def _get_inverse_translation_tables(cls, key):
+        # Anonymized chars are "@" (zero) and [A-Z]
+        return [
+            {
+                ord(char): cls._number_to_char(cls._char_to_number(char) - int(k))
+                for char in '@ABCDEFGHIJKLMNOPQRSTUVWXYZ'
+            }
+            for k in key
+        ]
+
+    def _normalize_value(self, value):
+        return NAME_NORMALIZATION_RE.sub('Q', remove_accent(value.strip()).upper())
+
+    def _translate_value(self, normalized_value, translation_tables):
+        translated_chars = list(normalized_value)
+        for i, translation_table in enumerate(translation_tables):
+            translated_chars[i::len(translation_tables)] = (
+                normalized_value[i::len(translation_tables)].translate(translation_table)
+            )
+        return ''.join(translated_chars)
+
     def get_anonymized_value(self, value):
-        normalized_value = re.sub(r'[^A-Z ]', 'Q', remove_accent(value.strip()).upper())
-        normalized_key = (
-            settings.ANONYMIZATION_NAME_KEY[i % len(settings.ANONYMIZATION_NAME_KEY)]
-            for i in range(len(normalized_value))
+        return self._translate_value(
+            self._normalize_value(value), self._get_translation_tables(settings.ANONYMIZATION_NAME_KEY)
         )
 
-        return ''.join([
-            v if v == ' ' else self._number_to_char(self._char_to_number(v) + int(k))
-            for k, v in zip(normalized_key, normalized_value)
-        ])
+    def get_deanonymized_value(self, value):
+        return self._translate_value(value, self._get_inverse_translation_tables(settings.ANONYMIZATION_NAME_KEY))
 
 
 class PhoneFieldAnonymizer(FieldAnonymizer):
@@ -124,28 +389,55 @@ class PhoneFieldAnonymizer(FieldAnonymizer):
     """
 
     ignore_empty_values = False
+    is_reversible = True
+
+    def _anonymize_phone(self, value, key):
+        return value[0:4] + '{0:09}'.format((int(value[4:]) + key) % 1000000000)
+
+    def get_deanonymized_value(self, value):
+        return self._anonymize_phone(value, -settings.ANONYMIZATION_PHONE_KEY)
 
     def get_anonymized_value(self, value):
-        return value[0:4] + '{0:09}'.format((int(value[4:]) + settings.ANONYMIZATION_PHONE_KEY) % 1000000000)
+        return self._anonymize_phone(value, settings.ANONYMIZATION_PHONE_KEY)
 
 
 class PersonalIIDFieldAnonymizer(FieldAnonymizer):
     """
     Personal ID anonymizer uses similar method like phone. To the personal ID control number is added numeric key.
+    Anonymization is not injective (some personal IDs with 3 and 4 digits control numbers are anonymized to the same
+    value), deanonymized value of such value is one of the originals.
     """
 
     empty_values = [None, '']
+    is_reversible = True
 
-    def get_anonymized_value(self, value):
+    def _anonymize_personal_id(self, value, key):
         max_control_number_digits = 4 if len(value) == 10 else 3
         control_number_subtraction = 9999 if len(value) == 10 else 990
-        updated_control_number = int(value[6:]) + settings.ANONYMIZATION_PERSONAL_ID_KEY
+        updated_control_number = int(value[6:]) + key
 
         return value[:6] + '{{0:0{}}}'.format(max_control_number_digits).format(
             updated_control_number if updated_control_number < 10 ** max_control_number_digits
             else updated_control_number - control_number_subtraction
         )
 
+    def get_anonymized_value(self, value):
+        return self._anonymize_personal_id(value, settings.ANONYMIZATION_PERSONAL_ID_KEY)
+
+    def get_deanonymized_value(self, value):
+        key = settings.ANONYMIZATION_PERSONAL_ID_KEY
+        anonymized_control_number = int(value[6:])
+        # Original length can differ from the anonymized one, candidates of both lengths are verified by anonymization
+        for max_control_number_digits in sorted((3, 4), key=lambda digits: digits != len(value) - 6):
+            control_number_subtraction = 9999 if max_control_number_digits == 4 else 990
+            for control_number in (anonymized_control_number - key,
+                                   anonymized_control_number + control_number_subtraction - key):
+                if 0 <= control_number < 10 ** max_control_number_digits:
+                    original_value = value[:6] + '{{0:0{}}}'.format(max_control_number_digits).format(control_number)
+                    if self._anonymize_personal_id(original_value, key) == value:
+                        return original_value
+        raise ValueError('Value "{}" is not anonymized personal ID'.format(value))
+
 
 class IDCardDataFieldAnonymizer(FieldAnonymizer):
     """
@@ -160,25 +452,113 @@ class IDCardDataFieldAnonymizer(FieldAnonymizer):
 
 class DummyFileAnonymizer(FieldAnonymizer):
     """
-    File anonymizer that replaces file with a anonymized variant.
+    File anonymizer that replaces file with a anonymized variant. Content of the anonymized variant is read only once
+    per process. In the shared mode the anonymized variant is stored to the field storage only once under the name
+    derived from its content hash and all anonymized values refer to this one file.
     """
 
-    def __init__(self, file_path, *args, **kwargs):
+    shared_directory = 'anonymized'
+    requires_model_instance = True
+    is_searchable = False
+    _file_contents = {}
+
+    def __init__(self, file_path, *args, shared=False, delete_original=False, **kwargs):
+        """
+        Args:
+            file_path: path of the anonymized variant relative to the ANONYMIZATION_PATH setting
+            shared: all anonymized values will refer to one stored file
+            delete_original: original files are removed from the storage after anonymized values are stored to the
+                database unless another row still refers to them, it can be used only with the shared mode
+        """
+        if delete_original and not shared:
+            raise ImproperlyConfigured('DummyFileAnonymizer can delete original files only in the shared mode')
+
         super().__init__(*args, **kwargs)
         self.file_path = file_path
+        self.shared = shared
+        self.delete_original = delete_original
+        self._shared_file_names = {}
+
+    def _get_file_content(self):
+        path = os.path.join(settings.ANONYMIZATION_PATH, self.file_path)
+        if path not in self._file_contents:
+            with open(path, mode='rb') as f:
+                self._file_contents[path] = f.read()
+        return self._file_contents[path]
+
+    def _get_shared_file_path(self, storage):
+        return storage.generate_filename(posixpath.join(
+            self.shared_directory,
+            '{}{}'.format(hashlib.sha1(self._get_file_content()).hexdigest(), splitext(self.file_path)[1])
+        ))
+
+    def _get_shared_file_name(self, storage):
+        if storage not in self._shared_file_names:
+            name = self._get_shared_file_path(storage)
+            if not storage.exists(name):
+                name = storage.save(name, ContentFile(self._get_file_content()))
+            self._shared_file_names[storage] = name
+        return self._shared_file_names[storage]
 
     def get_anonymized_value(self, value):
-        with open(os.path.join(settings.ANONYMIZATION_PATH, self.file_path), mode='rb') as f:
-            content = f.read()
-        value.save(basename(self.file_path), ContentFile(content), save=False)
+        if self.shared:
+            return self._get_shared_file_name(value.storage)
+
+        value.save(basename(self.file_path), ContentFile(self._get_file_content()), save=False)
         return value
 
+    def get_dumped_values_from_objs(self, objs, name):
+        """
+        Dumped values refer to the shared anonymized variant in both modes, the file is not written to the storage
+        (it is stored there by the first anonymization in the shared mode).
+        """
+        return [
+            self._get_shared_file_path(value.storage) if value else value
+            for value in (getattr(obj, name) for obj in objs)
+        ]
+
+    def get_anonymized_expression(self, expression, field, connection):
+        if not self.shared or self.delete_original:
+            return None
+        return Value(self._get_shared_file_name(field.storage), output_field=field)
+
+    def post_anonymize_batch(self, objs, name):
+        if not self.delete_original:
+            return
+
+        original_files = defaultdict(set)
+        for obj in objs:
+            value = getattr(obj, name)
+            if value and value.name != self._get_shared_file_name(value.storage):
+                original_files[value.storage].add(value.name)
+        for storage, file_names in original_files.items():
+            for file_name in file_names - self._get_referenced_file_names(storage, file_names):
+                storage.delete(file_name)
+
+    def _get_referenced_file_names(self, storage, file_names):
+        """
+        Returns:
+            set of file names which are still referenced by a file field of any model with the storage
+        """
+        referenced_file_names = set()
+        for model in apps.get_models():
+            for field in model._meta.concrete_fields:
+                if isinstance(field, FileField) and field.storage == storage:
+                    referenced_file_names.update(
+                        model._base_manager.using(router.db_for_write(model)).filter(
+                            **{'{}__in'.format(field.attname): file_names}
+                        ).values_list(field.attname, flat=True)
+                    )
+        return referenced_file_names
+
 
 class StaticValueAnonymizer(FieldAnonymizer):
     """
     Static value anonymizer replaces value with defined static value.
     """
 
+    is_searchable = False
+
     def __init__(self, value, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.value = value
@@ -186,6 +566,9 @@ class StaticValueAnonymizer(FieldAnonymizer):
     def get_anonymized_value(self, value):
         return self.value
 
+    def get_anonymized_expression(self, expression, field, connection):
+        return Value(self.value, output_field=field)
+
 
 class ModelAnonymizerBase(type):
     """
@@ -193,8 +576,6 @@ class ModelAnonymizerBase(type):
     defined in the class as attributes and store it to the fields property.
     """
     def __new__(cls, name, bases, attrs):
-        from anonymization.loading import register
-
         new_obj = super(ModelAnonymizerBase, cls).__new__(cls, name, bases, attrs)
 
         # Also ensure initialization is only performed for subclasses of ModelAnonymizer
@@ -220,21 +601,345 @@ class ModelAnonymizer(metaclass=ModelAnonymizerBase):
 
     can_anonymize_qs = False
     chunk_size = 10000
+    # Anonymized fields are recorded as AnonymizedData (audit log), it requires loading of primary keys and one row
+    # per object and field therefore it is opt-in for the bulk anonymization (callers can override it per call)
+    record_anonymized_data = False
+
+    def __init__(self):
+        # Time spent in field anonymizers, it is collected by the anonymization metrics
+        self.field_seconds = defaultdict(float)
 
     def anonymize_obj(self, obj):
-        updated_data = {name: field.get_anonymized_value_from_obj(obj, name) for name, field in self.fields.items()}
-        obj.__class__.objects.filter(pk=obj.pk).update(**updated_data)
+        self.anonymize_batch([obj])
+
+    def _post_anonymize_batch(self, objs, using, fields=None):
+        fields = self.fields if fields is None else fields
+
+        def post_anonymize_batch():
+            for name, field in fields.items():
+                field.post_anonymize_batch(objs, name)
+
+        # Hooks can remove data (e.g. original files) therefore they are called only if the transaction is committed
+        transaction.on_commit(post_anonymize_batch, using=using)
+
+    def get_update_expressions(self, connection):
+        """
+        Returns:
+            dict of field names and database anonymization expressions or None if any of the fields cannot be
+            anonymized in the database
+        """
+        if not self.fields:
+            return None
+
+        expressions = {}
+        for name, field in self.fields.items():
+            expression = field.get_db_expression(self.Meta.model._meta.get_field(name), connection)
+            if expression is None:
+                return None
+            expressions[name] = expression
+        return expressions
+
+    def is_qs_anonymizable(self, connection):
+        """
+        Queryset can be anonymized without loading objects if the anonymizer explicitly supports it or if all fields
+        can be anonymized directly in the database.
+        """
+        return self.can_anonymize_qs or self.get_update_expressions(connection) is not None
+
+    def _is_recorded(self, record):
+        return self.record_anonymized_data if record is None else record
+
+    def anonymize_qs(self, qs, record=None):
+        """
+        Anonymize whole queryset with one UPDATE statement. If anonymized data are recorded, primary keys of the
+        queryset are loaded to create AnonymizedData.
+
+        Args:
+            qs: anonymized queryset
+            record: anonymized fields are recorded as AnonymizedData, record_anonymized_data is used by default
+
+        Returns:
+            number of anonymized rows
+        """
+        from .models import AnonymizedData
+
+        using = router.db_for_write(qs.model)
+        update_expressions = self.get_update_expressions(connections[using])
+        if not self._is_recorded(record):
+            return qs.update(**update_expressions)
+
+        with transaction.atomic(using=using):
+            pks = list(qs.values_list('pk', flat=True))
+            anonymized_rows_count = qs.update(**update_expressions)
+            AnonymizedData.objects.create_anonymized_data(qs.model, pks, list(self.fields.keys()))
+        return anonymized_rows_count
+
+    def _get_update_batch_size(self, objs, fields, connection):
+        # Every object needs one parameter in the pk IN clause and two parameters (pk and value) per updated field
+        return max(connection.ops.bulk_batch_size(['pk'] * (2 * len(fields) + 1), objs), 1)
+
+    def _get_batch_update_data(self, model, pks, anonymized_values):
+        return {
+            name: Case(
+                *(When(pk=pk, then=Value(value, output_field=model._meta.get_field(name)))
+                  for pk, value in zip(pks, values)),
+                default=F(name),
+                output_field=model._meta.get_field(name)
+            )
+            for name, values in anonymized_values.items()
+        }
+
+    def _get_fields(self, field_names=None):
+        return (
+            self.fields if field_names is None
+            else OrderedDict((name, field) for name, field in self.fields.items() if name in field_names)
+        )
+
+    def get_rows(self, qs, field_names=None):
+        """
+        Load objects for the batch anonymization with only primary key and anonymized columns. Rows are lightweight
+        named tuples, model instances (with other fields deferred) are loaded only if a field anonymizer requires them.
+        Whole model instances are loaded for anonymizers with custom get_anonymized_value_from_obj.
+
+        Args:
+            qs: queryset of anonymized objects
+            field_names: names of anonymized fields, all anonymizer fields are anonymized by default
+
+        Returns:
+            iterable of rows or model instances
+        """
+        fields = self._get_fields(field_names)
+        if any(field._overrides_get_anonymized_value_from_obj() for field in fields.values()):
+            return qs.iterator()
+        elif any(field.is_model_instance_required() for field in fields.values()):
+            return qs.only(*fields.keys()).iterator()
+        else:
+            return iterate_rows(qs, list(fields.keys()))
+
+    def get_batches(self, qs, pk_from=None, chunk_size=None):
+        """
+        Args:
+            qs: queryset of anonymized objects
+            pk_from: only objects with greater primary key are returned (exclusive lower bound)
+            chunk_size: maximal number of objects in one batch or function that returns it before every batch,
+                anonymizer chunk_size is used by default
+
+        Returns:
+            generator of lists of rows (see get_rows) ordered by primary key
+        """
+        return keyset_iterator(qs, chunk_size or self.chunk_size, pk_from, self.get_rows)
+
+    def get_lookup_filter(self, **original_values):
+        """
+        Returns Q that finds anonymized objects by the original values of the fields. The original values are
+        anonymized and compared with equality therefore the query can use the field indexes instead of the table scan.
+
+        Args:
+            original_values: field names and their original values
+        """
+        q = Q()
+        for name, value in original_values.items():
+            if name not in self.fields:
+                raise ValueError('Field "{}" is not anonymized by {}'.format(name, self.__class__.__name__))
+            q &= Q(**{name: self.fields[name].get_lookup_value(value)})
+        return q
+
+    def filter_by_original_values(self, qs=None, **original_values):
+        """
+        Returns:
+            queryset of anonymized objects with the original field values, see get_lookup_filter
+        """
+        qs = self.Meta.model.objects.all() if qs is None else qs
+        return qs.filter(self.get_lookup_filter(**original_values))
+
+    def get_deanonymized_values(self, obj):
+        """
+        Returns:
+            dict of names and original values of the fields anonymized by the reversible anonymizers
+        """
+        deanonymized_values = OrderedDict()
+        for name, field in self.fields.items():
+            if field.is_reversible:
+                value = getattr(obj, name)
+                deanonymized_values[name] = (
+                    value if field._ignore_empty_values and value in field._empty_values
+                    else field.get_deanonymized_value(value)
+                )
+        return deanonymized_values
+
+    def anonymize_batch(self, objs, field_names=None, expired_reasons=None, record=None):
+        """
+        Anonymize list of objects of the same model. Anonymized values are computed in Python per field column and
+        written with one UPDATE statement (CASE WHEN per field) for every batch that fits to the database parameters
+        limit. All statements are executed in one transaction. Anonymized fields are recorded with bulk created
+        AnonymizedData if they are recorded.
+
+        Args:
+            objs: list of model instances or rows returned by get_rows that are anonymized
+            field_names: names of anonymized fields, all anonymizer fields are anonymized by default
+            expired_reasons: dict of object primary keys and IDs of LegalReasons whose expiration caused the
+                anonymization
+            record: anonymized fields are recorded as AnonymizedData, record_anonymized_data is used by default
+        """
+        from .models import AnonymizedData
+
+        fields = self._get_fields(field_names)
+        if not objs or not fields:
+            return
+
+        if not self._is_recorded(record):
+            self._anonymize_batch(objs, fields)
+            return
+
+        model = self.Meta.model
+        with transaction.atomic(using=router.db_for_write(model)):
+            self._anonymize_batch(objs, fields)
+            AnonymizedData.objects.create_anonymized_data(
+                model, [obj.pk for obj in objs], list(fields.keys()), expired_reasons
+            )
+
+    def get_anonymized_values(self, objs, field_names=None):
+        """
+        Compute anonymized values of the objects without writing them to the database. Time spent in field
+        anonymizers is collected to field_seconds.
+
+        Args:
+            objs: list of model instances or rows returned by get_rows
+            field_names: names of anonymized fields, all anonymizer fields are anonymized by default
+
+        Returns:
+            dict of field names and lists of anonymized values in the order of objs
+        """
+        anonymized_values = OrderedDict()
+        for name, field in self._get_fields(field_names).items():
+            start = time.perf_counter()
+            anonymized_values[name] = field.get_anonymized_values_from_objs(objs, name)
+            self.field_seconds[name] += time.perf_counter() - start
+        return anonymized_values
+
+    def get_dumped_values(self, objs):
+        """
+        Compute anonymized values of the objects for the anonymized dump, neither the database nor file storages are
+        changed.
+
+        Args:
+            objs: list of model instances or rows returned by get_rows
+
+        Returns:
+            dict of field names and lists of anonymized values in the order of objs
+        """
+        return OrderedDict(
+            (name, field.get_dumped_values_from_objs(objs, name)) for name, field in self.fields.items()
+        )
+
+    def _anonymize_batch(self, objs, fields):
+        self._write_anonymized_values(objs, fields, self.get_anonymized_values(objs, fields.keys()))
+
+    def _write_anonymized_values(self, objs, fields, anonymized_values):
+        model = self.Meta.model
+        using = router.db_for_write(model)
+        pks = [obj.pk for obj in objs]
+        batch_size = self._get_update_batch_size(objs, fields, connections[using])
+        with transaction.atomic(using=using):
+            for i in range(0, len(pks), batch_size):
+                model.objects.using(using).filter(pk__in=pks[i:i + batch_size]).update(
+                    **self._get_batch_update_data(
+                        model,
+                        pks[i:i + batch_size],
+                        {name: values[i:i + batch_size] for name, values in anonymized_values.items()}
+                    )
+                )
+            self._post_anonymize_batch(objs, using, fields)
 
 
 class DeleteModelAnonymizer(ModelAnonymizer):
     """
     The simpliest anonymization class that is used for removing whole input queryset.
+
+    Fast delete (opt-in with the fast_delete attribute) removes querysets with raw DELETE statements without the Django
+    collector, therefore objects are not loaded and delete signals are not sent. Cascades are planned in SQL: related
+    rows are deleted (CASCADE) or updated (SET_NULL) with the subquery of deleted rows before the rows are deleted.
+    Not filtered queryset of the model without relations is removed with TRUNCATE (it is not transactional on MySQL).
+    Fast delete is used only if no model of the cascade has delete signal receivers, parent models, generic relations
+    or relations with another on_delete handler (PROTECT, SET_DEFAULT, SET()) and the cascade has no cycles.
     """
 
     can_anonymize_qs = True
+    record_anonymized_data = False
+    fast_delete = False
+    truncate_vendors = {'postgresql', 'mysql'}
+
+    def _can_fast_delete_model(self, model, visited=()):
+        if model in visited:
+            return False
+        if (signals.pre_delete.has_listeners(model) or signals.post_delete.has_listeners(model) or
+                signals.m2m_changed.has_listeners(model)):
+            return False
+        if model._meta.parents or any(hasattr(field, 'bulk_related_objects') for field in model._meta.private_fields):
+            return False
+
+        for related in get_candidate_relations_to_delete(model._meta):
+            on_delete = related.field.remote_field.on_delete
+            if on_delete is CASCADE:
+                if not self._can_fast_delete_model(related.related_model, visited + (model,)):
+                    return False
+            elif on_delete is not SET_NULL and on_delete is not DO_NOTHING:
+                return False
+        return True
+
+    def can_fast_delete(self):
+        return self.fast_delete and self._can_fast_delete_model(self.Meta.model)
+
+    def can_truncate(self, qs):
+        """
+        Returns:
+            True if the queryset is whole table of the model which can be removed with TRUNCATE
+        """
+        return (
+            connections[router.db_for_write(qs.model)].vendor in self.truncate_vendors and
+            qs.query.can_filter() and not qs.query.where and
+            not any(get_candidate_relations_to_delete(qs.model._meta)) and
+            self.can_fast_delete()
+        )
+
+    def _fast_delete_qs(self, qs, using):
+        for related in get_candidate_relations_to_delete(qs.model._meta):
+            field = related.field
+            related_qs = related.related_model._base_manager.using(using).filter(
+                **{'{}__in'.format(field.name): qs.values(field.target_field.name)}
+            )
+            if field.remote_field.on_delete is CASCADE:
+                self._fast_delete_qs(related_qs, using)
+            elif field.remote_field.on_delete is SET_NULL:
+                related_qs.update(**{field.name: None})
+        return qs._raw_delete(using)
+
+    def _truncate(self, qs):
+        connection = connections[router.db_for_write(qs.model)]
+        deleted_rows_count = qs.count()
+        with connection.cursor() as cursor:
+            cursor.execute('TRUNCATE TABLE {}'.format(connection.ops.quote_name(qs.model._meta.db_table)))
+        return deleted_rows_count
 
     def anonymize_obj(self, obj):
         obj.__class__.objects.filter(pk=obj.pk).delete()
 
-    def anonymize_qs(self, qs):
-        qs.delete()
+    def anonymize_batch(self, objs, field_names=None, expired_reasons=None, record=None):
+        if objs:
+            self.anonymize_qs(self.Meta.model.objects.filter(pk__in=[obj.pk for obj in objs]))
+
+    def anonymize_qs(self, qs, record=None):
+        """
+        Deleted rows are never recorded as AnonymizedData.
+
+        Returns:
+            number of deleted rows of the queryset model
+        """
+        if self.can_truncate(qs):
+            return self._truncate(qs)
+        elif self.can_fast_delete():
+            using = router.db_for_write(qs.model)
+            with transaction.atomic(using=using):
+                return self._fast_delete_qs(qs, using)
+        else:
+            return qs.delete()[1].get(qs.model._meta.label, 0)
@@ -0,0 +1,149 @@
+import time
+
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+
+class LRUCache:
+    """
+    Least recently used cache with limited size. Cache counts hits and misses of the get method.
+    """
+
+    missing = object()
+
+    def __init__(self, max_size):
+        """
+        Args:
+            max_size: maximal number of stored items
+        """
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def get(self, key, default=missing):
+        """
+        Returns:
+            stored value or default (LRUCache.missing if it is not set) if key is not in the cache
+        """
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        if len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ConsentCache:
+    """
+    Cache of valid consents (Legal Reasons) stored with Django cache framework. Use locmem cache backend for
+    in-process cache or shared backend (memcached, redis) for cache shared between processes. Consent is cached
+    maximally to its expiration time. Cache counts hits and misses.
+    """
+
+    key_prefix = 'gdpr:consent'
+
+    def __init__(self, cache_alias, timeout):
+        """
+        Args:
+            cache_alias: alias of the Django cache
+            timeout: maximal time in seconds how long is consent (or its absence) cached
+        """
+        self.cache_alias = cache_alias
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def cache(self):
+        return caches[self.cache_alias]
+
+    def _get_cache_key(self, consent_key):
+        content_type_id, source_object_id, purpose_slug = consent_key
+        return '{}:{}:{}:{}'.format(self.key_prefix, content_type_id, source_object_id, purpose_slug)
+
+    def get_many(self, consent_keys):
+        """
+        Args:
+            consent_keys: list of tuples (content type ID, source object ID, purpose slug)
+
+        Returns:
+            dict of cached consent keys and boolean whether valid consent exists
+        """
+        cache_keys = {self._get_cache_key(consent_key): consent_key for consent_key in consent_keys}
+        cached_values = self.cache.get_many(list(cache_keys.keys()))
+        self.hits += len(cached_values)
+        self.misses += len(cache_keys) - len(cached_values)
+        now = time.time()
+        return {cache_keys[cache_key]: expires_at > now for cache_key, expires_at in cached_values.items()}
+
+    def get(self, consent_key):
+        """
+        Returns:
+            boolean whether valid consent exists or None if it is not cached
+        """
+        return self.get_many([consent_key]).get(consent_key)
+
+    def set_many(self, consents):
+        """
+        Args:
+            consents: dict of consent keys and expiration datetimes of valid consents (None if there is no valid
+                consent)
+        """
+        now = time.time()
+        timeouts = defaultdict(dict)
+        for consent_key, expires_at in consents.items():
+            expires_at = expires_at.timestamp() if expires_at else 0
+            timeout = self.timeout if not expires_at else min(self.timeout, int(expires_at - now))
+            if timeout > 0:
+                timeouts[timeout][self._get_cache_key(consent_key)] = expires_at
+        for timeout, cached_values in timeouts.items():
+            self.cache.set_many(cached_values, timeout)
+
+    def invalidate(self, consent_keys):
+        """
+        Remove consents from the cache now and again after the current transaction is committed to prevent caching
+        of values read by other processes before the commit.
+        """
+        cache_keys = [self._get_cache_key(consent_key) for consent_key in consent_keys]
+        if cache_keys:
+            self.cache.delete_many(cache_keys)
+            transaction.on_commit(lambda: self.cache.delete_many(cache_keys))
+
+
+_consent_cache = None
+
+
+def get_consent_cache():
+    """
+    Returns:
+        ConsentCache configured with settings GDPR_CONSENT_CACHE_ALIAS and GDPR_CONSENT_CACHE_TIMEOUT or None if the
+        cache is not enabled
+    """
+    global _consent_cache
+
+    cache_alias = getattr(settings, 'GDPR_CONSENT_CACHE_ALIAS', None)
+    if cache_alias is None:
+        return None
+    if _consent_cache is None or _consent_cache.cache_alias != cache_alias:
+        _consent_cache = ConsentCache(cache_alias, getattr(settings, 'GDPR_CONSENT_CACHE_TIMEOUT', 300))
+    return _consent_cache
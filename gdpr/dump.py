@@ -0,0 +1,432 @@
+import csv
+import gzip
+import io
+import os
+import queue
+import threading
+
+from collections import OrderedDict
+from types import SimpleNamespace
+
+from django.apps import apps
+from django.core.management.color import no_style
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import SET_NULL
+
+from .export import get_csv_value
+from .iterators import iterate_rows, keyset_iterator
+from .loading import register
+from .scheduling import AnonymizationSchedule, get_topological_order, is_foreign_key
+
+
+PIPELINE_END = object()
+
+
+def get_dumped_models(models=None):
+    """
+    Returns:
+        list of concrete managed models (including auto created many to many tables) ordered that referenced models
+        precede models that reference them, cyclic references are resolved in the application order
+    """
+    models = [
+        model for model in (models or apps.get_models(include_auto_created=True))
+        if model._meta.managed and not model._meta.proxy and not model._meta.swapped
+    ]
+    return get_topological_order(models, {
+        model: {
+            field.related_model for field in model._meta.concrete_fields
+            if is_foreign_key(field) and field.related_model is not model and field.related_model in models
+        }
+        for model in models
+    })
+
+
+def get_table_models(model):
+    """
+    Returns:
+        list of models whose tables store rows of the model (parents of multi-table inheritance first)
+    """
+    return list(reversed(model._meta.get_parent_list())) + [model]
+
+
+class DumpWriter:
+    """
+    Writer of the anonymized rows. Rows are tuples of values in the order of model concrete field attnames (fields of
+    multi-table inheritance parents included).
+    """
+
+    def prepare(self, models):
+        pass
+
+    def start_model(self, model, field_names):
+        pass
+
+    def write_rows(self, model, field_names, rows):
+        raise NotImplementedError
+
+    def finish_model(self, model):
+        pass
+
+    def close(self):
+        pass
+
+
+class DatabaseDumpWriter(DumpWriter):
+    """
+    Writes anonymized rows to the tables of another database alias with bulk inserts. PostgreSQL target can use COPY.
+    Tables must exist in the target database (e.g. created with "migrate --database"). Local fields of every table of
+    multi-table inherited models are inserted separately, values are written as they are (pre_save of auto_now fields
+    is not applied).
+    """
+
+    def __init__(self, using, clear=False, copy=False):
+        """
+        Args:
+            using: target database alias
+            clear: rows of the dumped models are removed from the target database before the dump
+            copy: rows are written with COPY FROM STDIN (PostgreSQL only)
+        """
+        self.using = using
+        self.clear = clear
+        self.copy = copy and connections[using].vendor == 'postgresql'
+
+    def prepare(self, models):
+        if self.clear:
+            table_models = get_dumped_models(list(OrderedDict.fromkeys(
+                table_model for model in models for table_model in get_table_models(model)
+            )))
+            for model in reversed(table_models):
+                model._base_manager.using(self.using).all()._raw_delete(self.using)
+
+    def _get_copy_value(self, value):
+        if value is None:
+            return ''
+        elif isinstance(value, (bytes, memoryview)):
+            value = '\\x{}'.format(bytes(value).hex())
+        elif hasattr(value, 'adapted'):
+            # psycopg2 adapters (e.g. Json of JSONField) wrap the Python value
+            value = value.dumps(value.adapted) if hasattr(value, 'dumps') else value.adapted
+        return '"{}"'.format(str(value).replace('"', '""'))
+
+    def _copy_rows(self, model, fields, rows):
+        connection = connections[self.using]
+        data = io.StringIO()
+        for row in rows:
+            data.write(','.join(
+                self._get_copy_value(field.get_db_prep_save(value, connection)) for field, value in zip(fields, row)
+            ))
+            data.write('\n')
+        data.seek(0)
+        with connection.cursor() as cursor:
+            cursor.cursor.copy_expert(
+                'COPY {} ({}) FROM STDIN WITH CSV'.format(
+                    connection.ops.quote_name(model._meta.db_table),
+                    ', '.join(connection.ops.quote_name(field.column) for field in fields)
+                ),
+                data
+            )
+
+    def _insert_rows(self, model, fields, rows):
+        objs = [SimpleNamespace(**dict(zip((field.attname for field in fields), row))) for row in rows]
+        batch_size = max(connections[self.using].ops.bulk_batch_size(fields, objs), 1)
+        for i in range(0, len(objs), batch_size):
+            model._base_manager.using(self.using)._insert(objs[i:i + batch_size], fields=fields, raw=True,
+                                                          using=self.using)
+
+    def write_rows(self, model, field_names, rows):
+        for table_model in get_table_models(model):
+            fields = table_model._meta.local_concrete_fields
+            indexes = [field_names.index(field.attname) for field in fields]
+            table_rows = [[row[i] for i in indexes] for row in rows]
+            if self.copy:
+                self._copy_rows(table_model, fields, table_rows)
+            else:
+                self._insert_rows(table_model, fields, table_rows)
+
+    def finish_model(self, model):
+        # Rows are inserted with primary keys therefore sequences must be moved after them
+        connection = connections[self.using]
+        sequence_reset_sql = connection.ops.sequence_reset_sql(no_style(), get_table_models(model))
+        if sequence_reset_sql:
+            with connection.cursor() as cursor:
+                for sql in sequence_reset_sql:
+                    cursor.execute(sql)
+
+
+class CSVDumpWriter(DumpWriter):
+    """
+    Writes anonymized rows to the directory as gzip compressed CSV files, one file (with header) per model. Rows of
+    multi-table inherited models contain fields of parents too. NULL is written as the null marker (by default "\\N"
+    like PostgreSQL COPY) therefore it differs from an empty string.
+    """
+
+    def __init__(self, directory, compresslevel=6, null='\\N'):
+        self.directory = directory
+        self.compresslevel = compresslevel
+        self.null = null
+        self.file = None
+        self.writer = None
+
+    def start_model(self, model, field_names):
+        os.makedirs(self.directory, exist_ok=True)
+        self.file = gzip.open(
+            os.path.join(self.directory, '{}.csv.gz'.format(model._meta.label_lower)), 'wt', encoding='utf-8',
+            newline='', compresslevel=self.compresslevel
+        )
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(field_names)
+
+    def write_rows(self, model, field_names, rows):
+        self.writer.writerows([self.null if value is None else get_csv_value(value) for value in row] for row in rows)
+
+    def finish_model(self, model):
+        self.file.close()
+        self.file = self.writer = None
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
+
+class AnonymizedDumpPipeline:
+    """
+    Dump of the database with anonymized data. The source database is not changed, rows are read in keyset chunks,
+    anonymized in Python with the registered model anonymizers and written with the dump writer. Reading,
+    anonymization and writing run in separate threads connected with bounded queues therefore they overlap and at
+    most queue_size chunks wait between two stages. Rows deleted by DeleteModelAnonymizer (and by its cascade) are
+    not dumped and SET_NULL foreign keys of the deleted rows are cleared. Row of multi-table inherited models is dumped
+    only once with its most derived dumped model and it is anonymized with anonymizers of the model and its parents.
+    Values are computed with get_dumped_values therefore file anonymizers don't write to the file storages. The source
+    database is read in one transaction (repeatable read on PostgreSQL and MySQL) therefore the dump is consistent.
+    """
+
+    def __init__(self, writer, models=None, using=DEFAULT_DB_ALIAS, chunk_size=10000, queue_size=4):
+        """
+        Args:
+            writer: DumpWriter instance
+            models: dumped models, all models are dumped by default
+            using: source database alias
+            chunk_size: number of rows read with one query
+            queue_size: maximal number of chunks waiting in every queue
+        """
+        self.writer = writer
+        self.models = get_dumped_models(models)
+        self.using = using
+        self.chunk_size = chunk_size
+        self.queue_size = queue_size
+        self.schedule = AnonymizationSchedule(register.get_anonymizers())
+        self.anonymizers = {}
+        self.stop_event = threading.Event()
+        self.errors = []
+
+    def get_anonymizers(self, model):
+        """
+        Returns:
+            list of anonymizers of the model and its multi-table inheritance parents, parents first
+        """
+        if model not in self.anonymizers:
+            self.anonymizers[model] = [
+                self.schedule.obj_anonymizers[table_model]() for table_model in get_table_models(model)
+                if table_model in self.schedule.obj_anonymizers
+            ]
+        return self.anonymizers[model]
+
+    def get_field_names(self, model):
+        return [field.attname for field in model._meta.concrete_fields]
+
+    def get_queryset(self, model):
+        qs = model._base_manager.using(self.using).all()
+        qs_filter = self.schedule.get_model_filter(model)
+        if qs_filter is False:
+            return None
+
+        for child_model in self.models:
+            if child_model is not model and model in child_model._meta.get_parent_list():
+                # Rows of multi-table inherited children are dumped with the child model
+                qs = qs.exclude(pk__in=child_model._base_manager.using(self.using).values('pk'))
+        return qs if qs_filter is None else qs.filter(qs_filter)
+
+    def get_rows(self, model, qs):
+        if any(field.is_model_instance_required()
+               for anonymizer in self.get_anonymizers(model) for field in anonymizer.fields.values()):
+            return qs.iterator()
+        else:
+            return iterate_rows(qs, self.get_field_names(model))
+
+    def _get_surviving_values(self, field, values):
+        """
+        Returns:
+            set of values of the field which belong to rows that are not deleted by the anonymization
+        """
+        model = field.model
+        model_filter = self.schedule.get_model_filter(model)
+        if model_filter is False:
+            return set()
+
+        values = list({value for value in values if value is not None})
+        batch_size = max(connections[self.using].ops.bulk_batch_size([field], values), 1)
+        surviving_values = set()
+        qs = model._base_manager.using(self.using).all() if model_filter is None else (
+            model._base_manager.using(self.using).filter(model_filter)
+        )
+        for i in range(0, len(values), batch_size):
+            surviving_values.update(qs.filter(**{'{}__in'.format(field.attname): values[i:i + batch_size]}).values_list(
+                field.attname, flat=True
+            ))
+        return surviving_values
+
+    def get_cleared_values(self, model, objs):
+        """
+        SET_NULL foreign keys which refer to rows deleted by the anonymization (by DeleteModelAnonymizer or its
+        cascade) are cleared the same way as the database would clear them.
+
+        Returns:
+            dict of SET_NULL foreign key attnames and lists of their values in the order of objs
+        """
+        cleared_values = {}
+        for field in model._meta.concrete_fields:
+            if (not is_foreign_key(field) or field.remote_field.on_delete is not SET_NULL or
+                    self.schedule.get_model_filter(field.related_model) is None):
+                continue
+
+            values = [getattr(obj, field.attname) for obj in objs]
+            surviving_values = self._get_surviving_values(field.target_field, values)
+            cleared_values[field.attname] = [value if value in surviving_values else None for value in values]
+        return cleared_values
+
+    def anonymize_rows(self, model, objs, cleared_values):
+        """
+        Args:
+            model: model of the objects
+            objs: list of model instances or rows
+            cleared_values: cleared foreign key values returned by get_cleared_values
+
+        Returns:
+            list of value tuples of the objects in the order of model concrete field attnames with anonymized values
+        """
+        field_names = self.get_field_names(model)
+        anonymized_values = {
+            model._meta.get_field(name).attname: values
+            for anonymizer in self.get_anonymizers(model) for name, values in anonymizer.get_dumped_values(objs).items()
+        }
+        columns = [
+            anonymized_values[field_name] if field_name in anonymized_values
+            else cleared_values[field_name] if field_name in cleared_values
+            else [getattr(obj, field_name) for obj in objs]
+            for field_name in field_names
+        ]
+        return list(zip(*columns))
+
+    def _put(self, output_queue, item):
+        while not self.stop_event.is_set():
+            try:
+                output_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _iterate(self, input_queue):
+        while not self.stop_event.is_set():
+            try:
+                item = input_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+            if item is PIPELINE_END:
+                return
+            yield item
+
+    def _run_stage(self, function, output_queue):
+        try:
+            function()
+        except BaseException as ex:
+            self.errors.append(ex)
+            self.stop_event.set()
+        finally:
+            self._put(output_queue, PIPELINE_END)
+            # Every thread has its own database connections
+            connections.close_all()
+
+    def _set_snapshot_isolation(self):
+        # The first statement of the transaction defines its isolation level, repeatable read transaction reads all
+        # tables from one snapshot therefore rows changed during the dump don't break references between dumped rows
+        connection = connections[self.using]
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY')
+            elif connection.vendor == 'mysql':
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ')
+
+    def _read(self, output_queue):
+        # All reads of the source database (rows and values of referenced rows) are done in one transaction
+        with transaction.atomic(using=self.using):
+            self._set_snapshot_isolation()
+            for model in self.models:
+                qs = self.get_queryset(model)
+                if qs is None:
+                    continue
+                for chunk in keyset_iterator(qs, self.chunk_size,
+                                             get_rows=lambda chunk_qs: self.get_rows(model, chunk_qs)):
+                    if not self._put(output_queue, (model, chunk, self.get_cleared_values(model, chunk))):
+                        return
+
+    def _anonymize(self, input_queue, output_queue):
+        for model, chunk, cleared_values in self._iterate(input_queue):
+            if not self._put(output_queue, (model, self.anonymize_rows(model, chunk, cleared_values))):
+                return
+
+    def _write(self, input_queue):
+        counts = OrderedDict()
+        current_model = None
+        self.writer.prepare(self.models)
+        for model, rows in self._iterate(input_queue):
+            field_names = self.get_field_names(model)
+            if model is not current_model:
+                if current_model is not None:
+                    self.writer.finish_model(current_model)
+                self.writer.start_model(model, field_names)
+                current_model = model
+                counts[model._meta.label_lower] = 0
+            self.writer.write_rows(model, field_names, rows)
+            counts[model._meta.label_lower] += len(rows)
+        if current_model is not None and not self.stop_event.is_set():
+            self.writer.finish_model(current_model)
+        return counts
+
+    def run(self):
+        """
+        Returns:
+            dict of model labels and numbers of dumped rows
+        """
+        read_queue = queue.Queue(self.queue_size)
+        anonymized_queue = queue.Queue(self.queue_size)
+        threads = [
+            threading.Thread(target=self._run_stage, args=(lambda: self._read(read_queue), read_queue)),
+            threading.Thread(target=self._run_stage, args=(
+                lambda: self._anonymize(read_queue, anonymized_queue), anonymized_queue
+            )),
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            counts = self._write(anonymized_queue)
+        except BaseException:
+            self.stop_event.set()
+            raise
+        finally:
+            for thread in threads:
+                thread.join()
+            self.writer.close()
+        if self.errors:
+            raise self.errors[0]
+        return counts
+
+
+def dump_anonymized(writer, models=None, using=DEFAULT_DB_ALIAS, chunk_size=10000, queue_size=4):
+    """
+    Dump the source database with anonymized data with the writer, see AnonymizedDumpPipeline.
+
+    Returns:
+        dict of model labels and numbers of dumped rows
+    """
+    return AnonymizedDumpPipeline(writer, models, using, chunk_size, queue_size).run()
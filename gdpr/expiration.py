@@ -0,0 +1,187 @@
+from collections import OrderedDict, defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .anonymizers import DeleteModelAnonymizer
+from .loading import get_anonymizer
+from .models import AnonymizationCheckpoint, LegalReason, LegalReasonRelatedObject
+from .purposes.default import purposes_map
+
+
+CHECKPOINT_KEY = 'anonymize_expired_data'
+
+
+def get_watermark():
+    """
+    Returns:
+        tuple (expires_at, pk) of the last processed expired LegalReason or (None, None)
+    """
+    value = AnonymizationCheckpoint.objects.get_value(CHECKPOINT_KEY)
+    if not value:
+        return None, None
+    expires_at, pk = value.rsplit('|', 1)
+    return parse_datetime(expires_at), int(pk)
+
+
+def set_watermark(legal_reason):
+    AnonymizationCheckpoint.objects.set_value(
+        CHECKPOINT_KEY, '{}|{}'.format(legal_reason.expires_at.isoformat(), legal_reason.pk)
+    )
+
+
+def get_expired_legal_reasons_qs(now, watermark_expires_at=None, watermark_pk=None):
+    qs = LegalReason.objects.filter(expires_at__lte=now)
+    if watermark_expires_at is not None:
+        qs = qs.filter(
+            Q(expires_at__gt=watermark_expires_at) | Q(expires_at=watermark_expires_at, pk__gt=watermark_pk)
+        )
+    return qs.order_by('expires_at', 'pk')
+
+
+def get_valid_purpose_slugs(source_object_keys, now):
+    """
+    Returns:
+        dict of source object keys (content type ID, object ID) and set of purpose slugs with valid consent
+    """
+    source_object_ids = defaultdict(set)
+    for content_type_id, object_id in source_object_keys:
+        source_object_ids[content_type_id].add(object_id)
+
+    q = Q()
+    for content_type_id, object_ids in source_object_ids.items():
+        q |= Q(source_object_content_type_id=content_type_id, source_object_id__in=object_ids)
+
+    valid_purpose_slugs = defaultdict(set)
+    if q:
+        for content_type_id, object_id, purpose_slug in LegalReason.objects.filter(q).filter(
+                is_active=True, expires_at__gt=now).values_list('source_object_content_type_id', 'source_object_id',
+                                                                 'purpose_slug'):
+            valid_purpose_slugs[(content_type_id, object_id)].add(purpose_slug)
+    return valid_purpose_slugs
+
+
+def get_related_object_keys(legal_reasons):
+    """
+    Returns:
+        dict of LegalReason IDs and list of related object keys (content type ID, object ID)
+    """
+    related_object_keys = defaultdict(list)
+    for legal_reason_id, content_type_id, object_id in LegalReasonRelatedObject.objects.filter(
+            legal_reason__in=[legal_reason.pk for legal_reason in legal_reasons]).values_list(
+                'legal_reason_id', 'object_content_type_id', 'object_id'):
+        related_object_keys[legal_reason_id].append((content_type_id, object_id))
+    return related_object_keys
+
+
+def get_expired_fields(legal_reasons, now):
+    """
+    Finds objects and fields that should be anonymized because of expired LegalReasons. Fields covered by another
+    valid purpose of the same source object are not anonymized.
+
+    Returns:
+        dict of models and dicts of object IDs and tuples (set of field names, expired LegalReason ID)
+    """
+    valid_purpose_slugs = get_valid_purpose_slugs(
+        {(legal_reason.source_object_content_type_id, legal_reason.source_object_id) for legal_reason in legal_reasons},
+        now
+    )
+    related_object_keys = get_related_object_keys(legal_reasons)
+
+    expired_fields = defaultdict(OrderedDict)
+    for legal_reason in legal_reasons:
+        purpose = purposes_map.get(legal_reason.purpose_slug)
+        if purpose is None:
+            continue
+
+        source_object_key = (legal_reason.source_object_content_type_id, legal_reason.source_object_id)
+        valid_purposes = [
+            purposes_map[purpose_slug] for purpose_slug in valid_purpose_slugs[source_object_key]
+            if purpose_slug in purposes_map
+        ]
+        for content_type_id, object_id in [source_object_key] + related_object_keys[legal_reason.pk]:
+            model = ContentType.objects.get_for_id(content_type_id).model_class()
+            if model is None:
+                continue
+
+            field_names = purpose.get_model_fields(model)
+            for valid_purpose in valid_purposes:
+                field_names -= valid_purpose.get_model_fields(model)
+            if field_names:
+                expired_object_fields = expired_fields[model].setdefault(object_id, (set(), legal_reason.pk))
+                expired_object_fields[0].update(field_names)
+    return expired_fields
+
+
+def anonymize_expired_objects(obj_anonymizer, model, expired_object_fields, batch_size=500):
+    """
+    Anonymize fields of the model objects. Anonymized fields are always recorded as AnonymizedData with the expired
+    LegalReason (regardless of record_anonymized_data of the anonymizer).
+
+    Args:
+        obj_anonymizer: ModelAnonymizer class of the model
+        model: Model of anonymized objects
+        expired_object_fields: dict of object IDs and tuples (set of field names, expired LegalReason ID)
+        batch_size: Number of objects loaded with one query
+    """
+    anonymizer = obj_anonymizer()
+    object_ids = list(expired_object_fields.keys())
+    for i in range(0, len(object_ids), batch_size):
+        qs = model.objects.filter(pk__in=object_ids[i:i + batch_size])
+        if isinstance(anonymizer, DeleteModelAnonymizer):
+            anonymizer.anonymize_batch(list(anonymizer.get_rows(qs)))
+            continue
+
+        objs_by_field_names = defaultdict(list)
+        for obj in anonymizer.get_rows(qs):
+            field_names = expired_object_fields[str(obj.pk)][0] & set(anonymizer.fields.keys())
+            if field_names:
+                objs_by_field_names[frozenset(field_names)].append(obj)
+
+        for field_names, field_names_objs in objs_by_field_names.items():
+            anonymizer.anonymize_batch(
+                field_names_objs,
+                field_names,
+                {obj.pk: expired_object_fields[str(obj.pk)][1] for obj in field_names_objs},
+                record=True
+            )
+
+
+def anonymize_expired_legal_reasons(legal_reasons, now):
+    """
+    Anonymize source and related objects fields of the expired LegalReasons. Only models with registered
+    anonymizer are anonymized.
+    """
+    for model, expired_object_fields in get_expired_fields(legal_reasons, now).items():
+        obj_anonymizer = get_anonymizer(model)
+        if obj_anonymizer is not None:
+            anonymize_expired_objects(obj_anonymizer, model, expired_object_fields)
+
+
+def anonymize_expired_data(now=None, chunk_size=1000):
+    """
+    Incrementally anonymize data of LegalReasons that expired since the last run. Position of the last processed
+    LegalReason is stored as the watermark after every chunk therefore interrupted run continues where it stopped.
+    Time of the run is proportional to the number of newly expired LegalReasons.
+
+    Args:
+        now: Time up to which expired LegalReasons are processed, current time by default
+        chunk_size: Number of LegalReasons processed in one transaction
+
+    Returns:
+        number of processed LegalReasons
+    """
+    now = now or timezone.now()
+    processed_count = 0
+    while True:
+        legal_reasons = list(get_expired_legal_reasons_qs(now, *get_watermark())[:chunk_size])
+        if not legal_reasons:
+            return processed_count
+
+        with transaction.atomic():
+            anonymize_expired_legal_reasons(legal_reasons, now)
+            set_watermark(legal_reasons[-1])
+        processed_count += len(legal_reasons)
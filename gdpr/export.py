@@ -0,0 +1,143 @@
+import csv
+import io
+import zipfile
+
+from collections import OrderedDict
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from .iterators import iterate_rows, keyset_iterator
+from .models import LegalReason, LegalReasonRelatedObject
+from .subject import iterate_subject_querysets
+
+
+class StreamBuffer:
+    """
+    Write-only file-like object that collects written data until it is popped, it is used to stream a ZIP archive
+    through a generator.
+    """
+
+    def __init__(self):
+        self.data = []
+
+    def write(self, data):
+        self.data.append(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = b''.join(self.data)
+        self.data = []
+        return data
+
+
+def iterate_export_querysets(source_object):
+    """
+    Returns:
+        generator of tuples (model, queryset of the exported subject objects), subject objects are extended with its
+        LegalReasons and their LegalReasonRelatedObjects
+    """
+    legal_reasons_qs = LegalReason.objects.filter_source_instance(source_object)
+    legal_reason_querysets = OrderedDict((
+        (LegalReason, legal_reasons_qs),
+        (LegalReasonRelatedObject, LegalReasonRelatedObject.objects.filter(legal_reason__in=legal_reasons_qs)),
+    ))
+    for model, qs in iterate_subject_querysets(source_object):
+        if model in legal_reason_querysets:
+            qs = model.objects.filter(
+                Q(pk__in=qs.values('pk')) | Q(pk__in=legal_reason_querysets.pop(model).values('pk'))
+            )
+        yield model, qs
+    yield from legal_reason_querysets.items()
+
+
+def get_csv_value(value):
+    if value is None:
+        return ''
+    elif isinstance(value, (str, int, float)):
+        return value
+    try:
+        return DjangoJSONEncoder().default(value)
+    except TypeError:
+        return str(value)
+
+
+def get_export_field_names(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def iterate_subject_rows(source_object, batch_size=1000):
+    """
+    Iterate over all data of one subject: objects found with LegalReasons, LegalReasonRelatedObjects and ForeignKeys
+    of the registered anonymizer models (see iterate_subject_querysets) with the LegalReasons and their
+    LegalReasonRelatedObjects. Objects are loaded as value tuples with one keyset query per batch of the model, only
+    one batch is held in memory.
+
+    Args:
+        source_object: Source object of the subject LegalReasons (e.g. customer or user)
+        batch_size: Number of objects loaded with one query
+
+    Returns:
+        generator of tuples (model, field names, list of value tuples)
+    """
+    for model, qs in iterate_export_querysets(source_object):
+        field_names = get_export_field_names(model)
+        for rows in keyset_iterator(qs, batch_size, get_rows=lambda chunk_qs: iterate_rows(chunk_qs, field_names)):
+            # Rows start with the primary key used by the keyset iteration
+            yield model, field_names, [row[1:] for row in rows]
+
+
+def export_subject_json_lines(source_object, batch_size=1000):
+    """
+    Export all data of one subject as JSON Lines, every line is one object with model label, primary key and field
+    values. Output can be streamed with StreamingHttpResponse.
+
+    Returns:
+        generator of text chunks, one chunk per batch of objects
+    """
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for model, field_names, rows in iterate_subject_rows(source_object, batch_size):
+        pk_index = field_names.index(model._meta.pk.attname)
+        yield ''.join(
+            encoder.encode({
+                'model': model._meta.label_lower,
+                'pk': row[pk_index],
+                'fields': dict(zip(field_names, row)),
+            }) + '\n'
+            for row in rows
+        )
+
+
+def export_subject_csv_zip(source_object, batch_size=1000):
+    """
+    Export all data of one subject as ZIP archive with one CSV file per model. Archive is written to a non-seekable
+    stream therefore it can be streamed with StreamingHttpResponse.
+
+    Returns:
+        generator of bytes chunks of the archive, one chunk per batch of objects
+    """
+    buffer = StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+        csv_file = None
+        current_model = None
+        for model, field_names, rows in iterate_subject_rows(source_object, batch_size):
+            if model is not current_model:
+                if csv_file is not None:
+                    csv_file.close()
+                csv_file = zip_file.open('{}.csv'.format(model._meta.label_lower), 'w', force_zip64=True)
+                current_model = model
+                rows = [field_names] + rows
+
+            text = io.StringIO()
+            writer = csv.writer(text)
+            for row in rows:
+                writer.writerow([get_csv_value(value) for value in row])
+            csv_file.write(text.getvalue().encode('utf-8'))
+            yield buffer.pop()
+
+        if csv_file is not None:
+            csv_file.close()
+    yield buffer.pop()
@@ -0,0 +1,19 @@
+from django.db.models import CharField, Func
+
+
+class MD5(Func):
+    """
+    Hexadecimal MD5 hash of the expression value. Function is supported only by PostgreSQL and MySQL backends,
+    use method is_supported to check it.
+    """
+
+    function = 'MD5'
+    supported_vendors = {'postgresql', 'mysql'}
+
+    def __init__(self, expression, **extra):
+        extra.setdefault('output_field', CharField())
+        super().__init__(expression, **extra)
+
+    @classmethod
+    def is_supported(cls, connection):
+        return connection.vendor in cls.supported_vendors
@@ -0,0 +1,85 @@
+from functools import lru_cache
+from operator import itemgetter
+
+
+@lru_cache()
+def get_row_class(field_names):
+    """
+    Returns:
+        tuple subclass with attributes "pk" and field names, unlike namedtuple it supports any field names (e.g.
+        "_order" field of order_with_respect_to)
+    """
+    attrs = {name: property(itemgetter(i)) for i, name in enumerate(('pk',) + field_names)}
+    attrs['__slots__'] = ()
+    return type('Row', (tuple,), attrs)
+
+
+def get_chunk_size(chunk_size):
+    return chunk_size() if callable(chunk_size) else chunk_size
+
+
+def iterate_rows(qs, field_names):
+    """
+    Iterate over the queryset rows that contain only primary key and the fields. Rows are lightweight tuples with
+    attributes "pk" and field names fetched with the database cursor without the model instances overhead.
+
+    Args:
+        qs: iterated queryset
+        field_names: names of loaded fields
+
+    Returns:
+        generator of rows
+    """
+    row_class = get_row_class(tuple(field_names))
+    for values in qs.values_list('pk', *field_names).iterator():
+        yield row_class(values)
+
+
+def keyset_iterator(qs, chunk_size, pk_from=None, get_rows=None):
+    """
+    Iterate over the queryset objects ordered by primary key. Every chunk is loaded with a "pk > last pk" query
+    therefore the speed doesn't degrade with the position like with OFFSET pagination.
+
+    Args:
+        qs: iterated queryset
+        chunk_size: maximal number of objects in one chunk or function that returns it before every chunk
+        pk_from: only objects with greater primary key are returned (exclusive lower bound)
+        get_rows: function that returns iterable of objects (with "pk" attribute) from the chunk queryset, model
+            instances are returned by default
+
+    Returns:
+        generator of lists of objects
+    """
+    qs = qs.order_by('pk')
+    get_rows = get_rows or (lambda chunk_qs: chunk_qs.iterator())
+    while True:
+        chunk_qs = qs if pk_from is None else qs.filter(pk__gt=pk_from)
+        chunk = list(get_rows(chunk_qs[:get_chunk_size(chunk_size)]))
+        if not chunk:
+            return
+        yield chunk
+        pk_from = chunk[-1].pk
+
+
+def keyset_queryset_iterator(qs, chunk_size, pk_from=None):
+    """
+    Split the queryset to primary key ranges with at most chunk_size rows. Only primary keys are loaded therefore
+    the returned querysets can be updated or deleted (rows are not loaded at all).
+
+    Args:
+        qs: split queryset
+        chunk_size: maximal number of rows in one queryset or function that returns it before every queryset
+        pk_from: only rows with greater primary key are returned (exclusive lower bound)
+
+    Returns:
+        generator of tuples (queryset, last primary key of the queryset)
+    """
+    pk_qs = qs.order_by('pk').values_list('pk', flat=True)
+    while True:
+        chunk_pk_qs = pk_qs if pk_from is None else pk_qs.filter(pk__gt=pk_from)
+        pks = list(chunk_pk_qs[:get_chunk_size(chunk_size)])
+        if not pks:
+            return
+        chunk_qs = qs.filter(pk__lte=pks[-1])
+        yield (chunk_qs if pk_from is None else chunk_qs.filter(pk__gt=pk_from)), pks[-1]
+        pk_from = pks[-1]
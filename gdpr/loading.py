@@ -1,4 +1,5 @@
 import six
+import threading
 
 from collections import OrderedDict
 
@@ -29,22 +30,33 @@ class AppAnonymizerLoader:
 
 class AnonymizersRegister:
     """
-    Register is storage for found anonymizer classes.
+    Register is storage for found anonymizer classes. Anonymizers are lazily loaded with the first access and only once
+    per process.
     """
 
     def __init__(self):
         self.anonymizers = OrderedDict()
+        self._initialized = False
+        self._lock = threading.RLock()
 
     def register_anonymizer(self, model, anonymizer):
         self.anonymizers[model] = anonymizer
 
     def _init_anonymizers(self):
-        for loader_path in settings.ANONYMIZATION_LOADERS:
-            if isinstance(loader_path, (list, tuple)):
-                for path in loader_path:
-                    import_module(path)
-            else:
-                str_to_class(loader_path)().import_anonymizers()
+        if self._initialized:
+            return
+
+        with self._lock:
+            if self._initialized:
+                return
+
+            for loader_path in settings.ANONYMIZATION_LOADERS:
+                if isinstance(loader_path, (list, tuple)):
+                    for path in loader_path:
+                        import_module(path)
+                else:
+                    str_to_class(loader_path)().import_anonymizers()
+            self._initialized = True
 
     def get_anonymizers(self):
         self._init_anonymizers()
@@ -52,6 +64,16 @@ class AnonymizersRegister:
         for anonymizer in self.anonymizers.values():
             yield anonymizer
 
+    def get_anonymizer(self, model):
+        """
+        Returns:
+            anonymizer class registered for the model or None if the model has no anonymizer
+        """
+        self._init_anonymizers()
+
+        return self.anonymizers.get(model)
+
 
 register = AnonymizersRegister()
 get_anonymizers = register.get_anonymizers
+get_anonymizer = register.get_anonymizer
@@ -1,58 +1,405 @@
-import math
+import json
+import time
 
-from django.core.management.base import BaseCommand
+from collections import OrderedDict
+
+from itertools import chain, zip_longest
+
+from multiprocessing import Pool
+
+import django
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, router, transaction
 
 import pyprind
 
 from gdpr.anonymizers import DeleteModelAnonymizer
+from gdpr.iterators import keyset_queryset_iterator
 from gdpr.loading import get_anonymizers
+from gdpr.metrics import AnonymizationMetrics, ChunkMeasurement, get_metrics_backend
+from gdpr.models import AnonymizationCheckpoint
+from gdpr.scheduling import AnonymizationSchedule
+from gdpr.throttling import AdaptiveChunkSize, Throttle
 
-from utils import chunked_iterator, chunked_queryset_iterator
 from utils.commands import ProgressBarStream
 
 
+CHECKPOINT_KEY_PREFIX = 'anonymize_data:'
+
+# Throttle of the worker process and whether its chunks count SQL queries, they are set by the pool initializer
+worker_throttle = None
+worker_count_queries = True
+
+
+def get_checkpoint_key(obj_anonymizer):
+    return '{}{}:{}.{}'.format(
+        CHECKPOINT_KEY_PREFIX, obj_anonymizer.Meta.model._meta.label_lower, obj_anonymizer.__module__,
+        obj_anonymizer.__name__
+    )
+
+
+def get_checkpoint_pk(obj_anonymizer):
+    """
+    Returns:
+        last primary key completely anonymized by the anonymizer or None if no checkpoint was stored
+    """
+    value = AnonymizationCheckpoint.objects.get_value(get_checkpoint_key(obj_anonymizer))
+    return None if value is None else obj_anonymizer.Meta.model._meta.pk.to_python(value)
+
+
+def set_checkpoint_pk(obj_anonymizer, pk):
+    AnonymizationCheckpoint.objects.set_value(get_checkpoint_key(obj_anonymizer), str(pk))
+
+
+def delete_checkpoint(obj_anonymizer):
+    AnonymizationCheckpoint.objects.filter(key=get_checkpoint_key(obj_anonymizer)).delete()
+
+
+def get_pk_ranges(qs, chunk_size, pk_from=None):
+    """
+    Split primary key space of the queryset to the disjoint ranges. Every range contains at most chunk_size rows.
+
+    Args:
+        qs: queryset whose primary keys are split
+        chunk_size: maximal number of rows in one range
+        pk_from: only primary keys greater than pk_from are split (exclusive lower bound of the first range)
+
+    Returns:
+        list of tuples (pk_from, pk_to), pk_from is exclusive (None means unbounded), pk_to is inclusive, the last
+        range ends with the greatest primary key of the queryset
+    """
+    pk_qs = filter_pk_range(qs, pk_from, None).order_by('pk').values_list('pk', flat=True)
+    last_pk = pk_qs.order_by('-pk').first()
+    if last_pk is None:
+        return []
+
+    boundaries = [pk_from]
+    while True:
+        range_qs = pk_qs if boundaries[-1] is None else pk_qs.filter(pk__gt=boundaries[-1])
+        next_boundary = list(range_qs[chunk_size - 1:chunk_size])
+        if not next_boundary or next_boundary[0] == last_pk:
+            break
+        boundaries.append(next_boundary[0])
+    return list(zip(boundaries, boundaries[1:] + [last_pk]))
+
+
+def filter_pk_range(qs, pk_from, pk_to):
+    if pk_from is not None:
+        qs = qs.filter(pk__gt=pk_from)
+    if pk_to is not None:
+        qs = qs.filter(pk__lte=pk_to)
+    return qs
+
+
+def init_worker(throttle=None, count_queries=True):
+    global worker_throttle, worker_count_queries
+
+    if not apps.ready:
+        django.setup()
+    worker_throttle = throttle
+    worker_count_queries = count_queries
+
+
+def anonymize_pk_range(obj_anonymizer, qs_filter, pk_from, pk_to):
+    """
+    Anonymize one primary key range of the model. Function is called in the worker process with its own database
+    connection.
+
+    Args:
+        obj_anonymizer: anonymizer class of the model
+        qs_filter: Q of anonymized rows or None if all rows are anonymized
+        pk_from: exclusive lower bound of primary keys
+        pk_to: inclusive upper bound of primary keys
+
+    Returns:
+        dict with measured data of the anonymized chunk (see ChunkMeasurement)
+    """
+    model = obj_anonymizer.Meta.model
+    qs = model.objects.all() if qs_filter is None else model.objects.filter(qs_filter)
+    qs = filter_pk_range(qs, pk_from, pk_to)
+    anonymizer = obj_anonymizer()
+    connection = connections[router.db_for_write(model)]
+    with ChunkMeasurement(anonymizer, connection, worker_count_queries) as measurement:
+        if anonymizer.is_qs_anonymizable(connection):
+            anonymized_rows_count = anonymizer.anonymize_qs(qs)
+        else:
+            objs = list(anonymizer.get_rows(qs))
+            anonymizer.anonymize_batch(objs)
+            anonymized_rows_count = len(objs)
+    return measurement.get_data(anonymized_rows_count)
+
+
+def anonymize_pk_range_task(task):
+    caches = get_caches(get_anonymizers())
+    initial_cache_stats = get_cache_stats(caches)
+    chunk = anonymize_pk_range(*task)
+    if worker_throttle is not None:
+        worker_throttle.wait(chunk['queries'], chunk['query_seconds'])
+    return task, chunk, OrderedDict(
+        (name, (hits - initial_cache_stats[name][0], misses - initial_cache_stats[name][1]))
+        for name, (hits, misses) in get_cache_stats(caches).items()
+    )
+
+
+def get_caches(obj_anonymizers):
+    """
+    Returns:
+        dict of caches used by field anonymizers, keys are labels of all fields that share the cache
+    """
+    caches = OrderedDict()
+    for obj_anonymizer in obj_anonymizers:
+        for name, field in obj_anonymizer.fields.items():
+            if field.cache is not None:
+                caches.setdefault(id(field.cache), ([], field.cache))[0].append(
+                    '{}.{}'.format(obj_anonymizer.Meta.model._meta.label_lower, name)
+                )
+    return OrderedDict((', '.join(labels), cache) for labels, cache in caches.values())
+
+
+def get_cache_stats(caches):
+    return OrderedDict((name, (cache.hits, cache.misses)) for name, cache in caches.items())
+
+
+class RangeCheckpointTracker:
+    """
+    Ranges are anonymized in the process pool in arbitrary order. Tracker stores checkpoint only for the longest
+    prefix of completed ranges therefore resumed run never skips unprocessed rows.
+    """
+
+    def __init__(self, obj_anonymizer, pk_ranges):
+        self.obj_anonymizer = obj_anonymizer
+        self.pk_tos = [pk_to for _, pk_to in pk_ranges]
+        self.completed_pk_tos = set()
+        self.position = 0
+
+    def complete(self, pk_to):
+        self.completed_pk_tos.add(pk_to)
+        checkpoint_pk = None
+        while self.position < len(self.pk_tos) and self.pk_tos[self.position] in self.completed_pk_tos:
+            checkpoint_pk = self.pk_tos[self.position]
+            self.position += 1
+        if checkpoint_pk is not None:
+            set_checkpoint_pk(self.obj_anonymizer, checkpoint_pk)
+
+
 class Command(BaseCommand):
     help = 'Anonymize database data according to defined anonymizers in applications.'
 
     def add_arguments(self, parser):
         parser.add_argument('--models', type=str, action='store', dest='models',
                             help='name of the anonymized models ("app_name.model_name") separated by a comma.')
+        parser.add_argument('--workers', type=int, action='store', dest='workers', default=1,
+                            help='number of processes that anonymize disjoint primary key ranges of models.')
+        parser.add_argument('--resume', action='store_true', dest='resume', default=False,
+                            help='continue the interrupted run from the last stored checkpoint of every model.')
+        parser.add_argument('--report', type=str, action='store', dest='report',
+                            help='path of the JSON report with metrics of anonymized models and fields.')
+        parser.add_argument('--adaptive', action='store_true', dest='adaptive', default=False,
+                            help='adjust chunk size of every model toward the target chunk time (sequential run only, '
+                                 'it cannot be combined with --workers).')
+        parser.add_argument('--target-chunk-seconds', type=float, action='store', dest='target_chunk_seconds',
+                            default=1.0, help='target wall time of one chunk of the adaptive mode.')
+        parser.add_argument('--min-chunk-size', type=int, action='store', dest='min_chunk_size', default=100,
+                            help='minimal chunk size of the adaptive mode.')
+        parser.add_argument('--max-chunk-size', type=int, action='store', dest='max_chunk_size', default=100000,
+                            help='maximal chunk size of the adaptive mode.')
+        parser.add_argument('--max-statement-seconds', type=float, action='store', dest='max_statement_seconds',
+                            help='pause between chunks while the average SQL statement time of the chunk exceeds it.')
+        parser.add_argument('--max-replica-lag', type=float, action='store', dest='max_replica_lag',
+                            help='pause between chunks while the replication lag (seconds) measured with the probe '
+                                 'configured in the GDPR_REPLICA_LAG_PROBE setting exceeds it.')
+
+    def _get_chunk_size(self, obj_anonymizer):
+        if self.adaptive_options is None:
+            return obj_anonymizer.chunk_size
+        return AdaptiveChunkSize(obj_anonymizer.chunk_size, **self.adaptive_options)
+
+    def _finish_chunk(self, obj_anonymizer, chunk_size, chunk):
+        self.metrics.add_chunk(obj_anonymizer, **chunk)
+        if isinstance(chunk_size, AdaptiveChunkSize):
+            chunk_size.update(chunk['rows'], chunk['seconds'])
+        if self.throttle is not None:
+            self.throttle.wait(chunk['queries'], chunk['query_seconds'])
 
-    def _anonymize_by_qs(self, obj_anonymizer, qs):
+    def _anonymize_by_qs(self, obj_anonymizer, qs, pk_from):
         bar = pyprind.ProgBar(
-            max(math.ceil(qs.count() // obj_anonymizer.chunk_size), 1),
+            max(qs.count(), 1),
             title='Anonymize model {}'.format(self._get_full_model_name(qs.model)),
             stream=ProgressBarStream(self.stdout)
         )
-        for batch_qs in chunked_queryset_iterator(qs, obj_anonymizer.chunk_size, delete_qs=isinstance(
-                obj_anonymizer, DeleteModelAnonymizer)):
-            obj_anonymizer().anonymize_qs(batch_qs)
-            bar.update()
+        anonymizer = obj_anonymizer()
+        using = router.db_for_write(qs.model)
+        chunk_size = self._get_chunk_size(obj_anonymizer)
+        if isinstance(anonymizer, DeleteModelAnonymizer) and anonymizer.can_truncate(qs):
+            # Whole table is removed at once
+            batches = [(qs, None)]
+        else:
+            batches = keyset_queryset_iterator(qs, chunk_size, pk_from)
+        for batch_qs, last_pk in batches:
+            with ChunkMeasurement(anonymizer, connections[using], self.count_queries) as measurement:
+                with transaction.atomic(using=using):
+                    anonymized_rows_count = anonymizer.anonymize_qs(batch_qs)
+                    if last_pk is not None:
+                        set_checkpoint_pk(obj_anonymizer, last_pk)
+            bar.update(iterations=anonymized_rows_count)
+            self._finish_chunk(obj_anonymizer, chunk_size, measurement.get_data(anonymized_rows_count))
 
-    def _anonymize_by_obj(self, obj_anonymizer, qs):
+    def _anonymize_by_obj(self, obj_anonymizer, qs, pk_from):
         bar = pyprind.ProgBar(
-            qs.count(),
+            max(qs.count(), 1),
             title='Anonymize model {}'.format(self._get_full_model_name(qs.model)),
             stream=ProgressBarStream(self.stdout)
         )
-        for obj in chunked_iterator(qs, obj_anonymizer.chunk_size):
-            obj_anonymizer().anonymize_obj(obj)
-            bar.update()
-
-    def _anonymize(self, obj_anonymizer, model):
-        qs = model.objects.all()
-        if obj_anonymizer.can_anonymize_qs:
-            self._anonymize_by_qs(obj_anonymizer, qs)
+        anonymizer = obj_anonymizer()
+        using = router.db_for_write(qs.model)
+        chunk_size = self._get_chunk_size(obj_anonymizer)
+        # Loading of the batch is measured as a part of the chunk
+        measurement = ChunkMeasurement(anonymizer, connections[using], self.count_queries).start()
+        try:
+            for batch in anonymizer.get_batches(qs, pk_from, chunk_size):
+                with transaction.atomic(using=using):
+                    anonymizer.anonymize_batch(batch)
+                    set_checkpoint_pk(obj_anonymizer, batch[-1].pk)
+                measurement.stop()
+                bar.update(iterations=len(batch))
+                self._finish_chunk(obj_anonymizer, chunk_size, measurement.get_data(len(batch)))
+                measurement.start()
+        finally:
+            measurement.stop()
+
+    def _anonymize(self, obj_anonymizer, qs):
+        pk_from = get_checkpoint_pk(obj_anonymizer)
+        qs = filter_pk_range(qs, pk_from, None)
+        if obj_anonymizer().is_qs_anonymizable(connections[router.db_for_write(qs.model)]):
+            self._anonymize_by_qs(obj_anonymizer, qs, pk_from)
         else:
-            self._anonymize_by_obj(obj_anonymizer, qs)
+            self._anonymize_by_obj(obj_anonymizer, qs, pk_from)
+        # Only interrupted run can be resumed, the next run must anonymize all rows again
+        delete_checkpoint(obj_anonymizer)
+
+    def _get_queryset(self, schedule, obj_anonymizer):
+        return filter_pk_range(schedule.get_queryset(obj_anonymizer), get_checkpoint_pk(obj_anonymizer), None)
+
+    def _get_pk_range_tasks(self, schedule, obj_anonymizers, checkpoint_trackers):
+        models_tasks = []
+        for obj_anonymizer in obj_anonymizers:
+            pk_from = get_checkpoint_pk(obj_anonymizer)
+            qs = filter_pk_range(schedule.get_queryset(obj_anonymizer), pk_from, None)
+            anonymizer = obj_anonymizer()
+            if isinstance(anonymizer, DeleteModelAnonymizer) and anonymizer.can_truncate(qs):
+                # Whole table is removed at once by one task
+                pk_ranges = [(None, None)]
+            else:
+                # Ranges start after the checkpoint therefore already anonymized rows are not anonymized again
+                pk_ranges = get_pk_ranges(qs, obj_anonymizer.chunk_size, pk_from)
+            checkpoint_trackers[obj_anonymizer] = RangeCheckpointTracker(obj_anonymizer, pk_ranges)
+            qs_filter = schedule.get_filter(obj_anonymizer)
+            models_tasks.append([(obj_anonymizer, qs_filter, pk_from, pk_to) for pk_from, pk_to in pk_ranges])
+        return [task for task in chain.from_iterable(zip_longest(*models_tasks)) if task is not None]
+
+    def _anonymize_parallel(self, schedule, workers):
+        """
+        Primary key space of every model is split to ranges which are anonymized in the process pool. Models are
+        anonymized in stages of the schedule, ranges of all models of one stage (models of independent components)
+        are interleaved therefore they are anonymized concurrently. Ranges of the stage are computed when the previous
+        stage is finished.
+        """
+        obj_anonymizers = schedule.get_ordered_anonymizers()
+        bar = pyprind.ProgBar(
+            max(sum(self._get_queryset(schedule, obj_anonymizer).count() for obj_anonymizer in obj_anonymizers), 1),
+            title='Anonymize models {}'.format(', '.join(
+                self._get_full_model_name(obj_anonymizer.Meta.model) for obj_anonymizer in obj_anonymizers
+            )),
+            stream=ProgressBarStream(self.stdout)
+        )
+        cache_stats = OrderedDict((name, [0, 0]) for name in get_caches(obj_anonymizers).keys())
+        checkpoint_trackers = {}
+        # Workers must not share connections opened by the parent process
+        connections.close_all()
+        with Pool(workers, initializer=init_worker, initargs=(self.throttle, self.count_queries)) as pool:
+            for stage in schedule.get_stages():
+                tasks = self._get_pk_range_tasks(schedule, stage, checkpoint_trackers)
+                for task, chunk, task_cache_stats in pool.imap_unordered(anonymize_pk_range_task, tasks):
+                    obj_anonymizer, _, _, pk_to = task
+                    checkpoint_trackers[obj_anonymizer].complete(pk_to)
+                    self.metrics.add_chunk(obj_anonymizer, **chunk)
+                    bar.update(iterations=chunk['rows'])
+                    for name, (hits, misses) in task_cache_stats.items():
+                        if name in cache_stats:
+                            cache_stats[name][0] += hits
+                            cache_stats[name][1] += misses
+                # Only interrupted run can be resumed, the next run must anonymize all rows of the stage again
+                for obj_anonymizer in stage:
+                    delete_checkpoint(obj_anonymizer)
+        return cache_stats
 
     def _get_full_model_name(self, model):
         return '{}.{}'.format(model._meta.app_label, model._meta.model_name)
 
-    def handle(self, models, *args, **options):
+    def _write_report(self, path, seconds, workers, cache_stats):
+        models_report = self.metrics.get_report()
+        rows = sum(model_report['rows'] for model_report in models_report.values())
+        report = OrderedDict((
+            ('seconds', seconds),
+            ('rows', rows),
+            ('rows_per_second', rows / seconds if seconds else None),
+            ('workers', workers),
+            # Pauses of the worker processes are not collected
+            ('throttled_seconds', (
+                self.throttle.throttled_seconds if self.throttle is not None and workers <= 1 else None
+            )),
+            ('models', models_report),
+            ('caches', OrderedDict(
+                (name, OrderedDict((('hits', hits), ('misses', misses))))
+                for name, (hits, misses) in cache_stats.items()
+            )),
+        ))
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    def handle(self, models, workers, resume, report=None, adaptive=False, target_chunk_seconds=1.0,
+               min_chunk_size=100, max_chunk_size=100000, max_statement_seconds=None, max_replica_lag=None, *args,
+               **options):
+        if adaptive and workers > 1:
+            raise CommandError('Adaptive chunk size cannot be used with more workers, parallel run splits primary key '
+                               'ranges with the anonymizer chunk size.')
+
         models = {v.strip().lower() for v in models.split(',')} if models else None
-        for obj_anonymizer in list(get_anonymizers()):
-            model = obj_anonymizer.Meta.model
-            if not models or self._get_full_model_name(model) in models:
-                self._anonymize(obj_anonymizer, model)
+        obj_anonymizers = [
+            obj_anonymizer for obj_anonymizer in get_anonymizers()
+            if not models or self._get_full_model_name(obj_anonymizer.Meta.model) in models
+        ]
+        if not resume:
+            for obj_anonymizer in obj_anonymizers:
+                delete_checkpoint(obj_anonymizer)
+
+        schedule = AnonymizationSchedule(obj_anonymizers)
+        self.metrics = AnonymizationMetrics(get_metrics_backend())
+        self.adaptive_options = {
+            'target_seconds': target_chunk_seconds,
+            'min_size': min_chunk_size,
+            'max_size': max_chunk_size,
+        } if adaptive else None
+        self.throttle = Throttle(
+            max_statement_seconds, max_replica_lag
+        ) if max_statement_seconds is not None or max_replica_lag is not None else None
+        # Query counting forces the debug cursor therefore it is enabled only if the measured queries are consumed
+        self.count_queries = bool(report) or max_statement_seconds is not None or self.metrics.has_consumers()
+        start = time.perf_counter()
+        if workers > 1:
+            cache_stats = self._anonymize_parallel(schedule, workers)
+        else:
+            for obj_anonymizer in schedule.get_ordered_anonymizers():
+                self._anonymize(obj_anonymizer, schedule.get_queryset(obj_anonymizer))
+            cache_stats = get_cache_stats(get_caches(obj_anonymizers))
+        seconds = time.perf_counter() - start
+        self.metrics.flush()
+
         self.stdout.write('Data was anonymized')
+        for name, (hits, misses) in cache_stats.items():
+            self.stdout.write('Cache {}: {} hits, {} misses'.format(name, hits, misses))
+        if self.throttle is not None and workers <= 1:
+            self.stdout.write('Throttled for {:.1f} s'.format(self.throttle.throttled_seconds))
+        if report:
+            self._write_report(report, seconds, workers, cache_stats)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from gdpr.expiration import anonymize_expired_data
+
+
+class Command(BaseCommand):
+    help = 'Anonymize data of legal reasons that expired since the last run.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, action='store', dest='chunk_size', default=1000,
+                            help='number of expired legal reasons processed in one transaction.')
+
+    def handle(self, chunk_size, *args, **options):
+        self.stdout.write('Expired legal reasons processed: {}'.format(anonymize_expired_data(chunk_size=chunk_size)))
@@ -0,0 +1,46 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from gdpr.dump import CSVDumpWriter, DatabaseDumpWriter, dump_anonymized
+
+
+class Command(BaseCommand):
+    help = ('Dump database with anonymized data to another database or to gzip compressed CSV files. Source database '
+            'is not changed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', action='store', dest='database',
+                            help='target database alias, its tables must exist.')
+        parser.add_argument('--output', action='store', dest='output',
+                            help='target directory of gzip compressed CSV files (one per model).')
+        parser.add_argument('--source', action='store', dest='source', default=DEFAULT_DB_ALIAS,
+                            help='source database alias.')
+        parser.add_argument('--models', action='store', dest='models',
+                            help='comma separated model labels (app_label.ModelName), all models are dumped by '
+                                 'default.')
+        parser.add_argument('--chunk-size', type=int, action='store', dest='chunk_size', default=10000,
+                            help='number of rows read with one query.')
+        parser.add_argument('--queue-size', type=int, action='store', dest='queue_size', default=4,
+                            help='maximal number of chunks waiting between pipeline stages.')
+        parser.add_argument('--clear', action='store_true', dest='clear', default=False,
+                            help='remove rows of the dumped models from the target database before the dump.')
+        parser.add_argument('--copy', action='store_true', dest='copy', default=False,
+                            help='write rows with COPY to the PostgreSQL target database.')
+        parser.add_argument('--null', action='store', dest='null', default='\\N',
+                            help='string written to CSV files for NULL values (default "\\N").')
+
+    def handle(self, database, output, source, models, chunk_size, queue_size, clear, copy, null, *args, **options):
+        if bool(database) == bool(output):
+            raise CommandError('Exactly one of --database and --output must be set.')
+        if database == source:
+            raise CommandError('Target database must differ from the source database.')
+
+        try:
+            models = [apps.get_model(label.strip()) for label in models.split(',')] if models else None
+        except (LookupError, ValueError) as ex:
+            raise CommandError(str(ex))
+
+        writer = DatabaseDumpWriter(database, clear=clear, copy=copy) if database else CSVDumpWriter(output, null=null)
+        for label, rows_count in dump_anonymized(writer, models, source, chunk_size, queue_size).items():
+            self.stdout.write('{}: {} rows dumped'.format(label, rows_count))
@@ -0,0 +1,37 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from gdpr.export import export_subject_csv_zip, export_subject_json_lines
+
+
+class Command(BaseCommand):
+    help = 'Export all data of one subject (source object of legal reasons).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help='source object model label (app_label.ModelName).')
+        parser.add_argument('pk', help='source object primary key.')
+        parser.add_argument('output', help='path of the export file.')
+        parser.add_argument('--format', action='store', dest='export_format', choices=('jsonl', 'csv'),
+                            default='jsonl', help='JSON Lines or ZIP archive of CSV files per model.')
+        parser.add_argument('--batch-size', type=int, action='store', dest='batch_size', default=1000,
+                            help='number of objects loaded with one query.')
+
+    def handle(self, model, pk, export_format, output, batch_size, *args, **options):
+        try:
+            model_class = apps.get_model(model)
+        except (LookupError, ValueError):
+            raise CommandError('Model "{}" does not exist.'.format(model))
+
+        try:
+            source_object = model_class.objects.get(pk=pk)
+        except (model_class.DoesNotExist, ValueError):
+            raise CommandError('Object "{}" with primary key "{}" does not exist.'.format(model, pk))
+
+        if export_format == 'csv':
+            with open(output, 'wb') as f:
+                for chunk in export_subject_csv_zip(source_object, batch_size):
+                    f.write(chunk)
+        else:
+            with open(output, 'w', encoding='utf-8') as f:
+                for chunk in export_subject_json_lines(source_object, batch_size):
+                    f.write(chunk)
@@ -0,0 +1,33 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+
+from gdpr.subject import forget_subject
+
+
+class Command(BaseCommand):
+    help = 'Anonymize all data of one subject (source object of legal reasons).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help='source object model label (app_label.ModelName).')
+        parser.add_argument('pk', help='source object primary key.')
+        parser.add_argument('--keep-legal-reasons', action='store_true', dest='keep_legal_reasons', default=False,
+                            help='do not deactivate legal reasons of the subject.')
+        parser.add_argument('--follow-related-objects', action='store_true', dest='follow_related_objects',
+                            default=False, help='anonymize objects that reference related objects of legal reasons '
+                                                '(use it only if related objects are not shared by more subjects).')
+
+    def handle(self, model, pk, keep_legal_reasons, follow_related_objects, *args, **options):
+        try:
+            model_class = apps.get_model(model)
+        except (LookupError, ValueError):
+            raise CommandError('Model "{}" does not exist.'.format(model))
+
+        try:
+            source_object = model_class.objects.get(pk=pk)
+        except (model_class.DoesNotExist, ValueError):
+            raise CommandError('Object "{}" with primary key "{}" does not exist.'.format(model, pk))
+
+        anonymized_counts = forget_subject(source_object, keep_legal_reasons=keep_legal_reasons,
+                                           follow_related_objects=follow_related_objects)
+        for label, anonymized_count in anonymized_counts.items():
+            self.stdout.write('{}: {} objects anonymized'.format(label, anonymized_count))
@@ -0,0 +1,279 @@
+import math
+import os
+import socket
+import time
+
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .signals import anonymization_chunk_finished
+
+
+def get_percentile(sorted_values, percentile):
+    """
+    Returns:
+        nearest-rank percentile of the sorted values or None if there are no values
+    """
+    if not sorted_values:
+        return None
+    return sorted_values[max(int(math.ceil(percentile / 100 * len(sorted_values))) - 1, 0)]
+
+
+class QueryCounter:
+    """
+    Context manager that counts SQL queries of the connection and their time. It replaces the connection queries log
+    (debug cursor is forced) with itself therefore the queries are not stored and their count is not limited.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.count = 0
+        self.seconds = 0.0
+
+    def append(self, query):
+        self.count += 1
+        self.seconds += float(query['time'])
+
+    def __enter__(self):
+        self._queries_log = self.connection.queries_log
+        self._force_debug_cursor = self.connection.force_debug_cursor
+        self.connection.queries_log = self
+        self.connection.force_debug_cursor = True
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.connection.queries_log = self._queries_log
+        self.connection.force_debug_cursor = self._force_debug_cursor
+
+
+class ChunkMeasurement:
+    """
+    Context manager that measures one anonymized chunk: wall time, SQL queries and time spent in field anonymizers.
+    Counting of SQL queries forces the debug cursor which formats every executed query therefore it is enabled only
+    with count_queries. Stop is idempotent, measurement can be safely stopped in the finally block.
+    """
+
+    def __init__(self, anonymizer, connection, count_queries=True):
+        self.anonymizer = anonymizer
+        self.connection = connection
+        self.count_queries = count_queries
+        self.query_counter = None
+        self.seconds = None
+        self._start = None
+
+    def start(self):
+        self.anonymizer.field_seconds.clear()
+        self.query_counter = QueryCounter(self.connection).__enter__() if self.count_queries else None
+        self._start = time.perf_counter()
+        return self
+
+    def stop(self):
+        if self._start is None:
+            return self
+
+        self.seconds = time.perf_counter() - self._start
+        self._start = None
+        if self.query_counter is not None:
+            self.query_counter.__exit__(None, None, None)
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def get_data(self, rows):
+        """
+        Returns:
+            dict with measured data of the chunk with the number of anonymized rows
+        """
+        return {
+            'rows': rows,
+            'seconds': self.seconds,
+            'queries': self.query_counter.count if self.query_counter is not None else 0,
+            'query_seconds': self.query_counter.seconds if self.query_counter is not None else 0.0,
+            'field_seconds': dict(self.anonymizer.field_seconds),
+        }
+
+
+class MetricsBackend:
+    """
+    Metrics backend receives metrics of the anonymized chunks. Labels are dict with "model" and optionally "field".
+    """
+
+    def increment(self, name, value, labels):
+        raise NotImplementedError
+
+    def timing(self, name, seconds, labels):
+        raise NotImplementedError
+
+    def flush(self):
+        pass
+
+
+class StatsDMetricsBackend(MetricsBackend):
+    """
+    Sends metrics to the StatsD daemon with UDP, labels are part of the metric name
+    (e.g. "gdpr.anonymization.testapp_customer.email.field_seconds").
+    """
+
+    def __init__(self, host='localhost', port=8125, prefix='gdpr.anonymization'):
+        self.address = (host, port)
+        self.prefix = prefix
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def _get_name(self, name, labels):
+        return '.'.join(
+            [self.prefix] + [str(labels[key]).replace('.', '_') for key in ('model', 'field') if key in labels] + [name]
+        )
+
+    def _send(self, metric):
+        try:
+            self.socket.sendto(metric.encode('utf-8'), self.address)
+        except OSError:
+            # Metrics must never break anonymization
+            pass
+
+    def increment(self, name, value, labels):
+        self._send('{}:{}|c'.format(self._get_name(name, labels), value))
+
+    def timing(self, name, seconds, labels):
+        self._send('{}:{:.3f}|ms'.format(self._get_name(name, labels), seconds * 1000))
+
+
+class PrometheusMetricsBackend(MetricsBackend):
+    """
+    Aggregates metrics as Prometheus counters and writes them in the text exposition format to the file that can be
+    exported with the node exporter textfile collector.
+    """
+
+    def __init__(self, path, prefix='gdpr_anonymization'):
+        self.path = path
+        self.prefix = prefix
+        self.counters = OrderedDict()
+
+    def _add(self, name, value, labels):
+        key = (name, tuple(sorted(labels.items())))
+        self.counters[key] = self.counters.get(key, 0) + value
+
+    def increment(self, name, value, labels):
+        self._add('{}_{}_total'.format(self.prefix, name), value, labels)
+
+    def timing(self, name, seconds, labels):
+        self._add('{}_{}_total'.format(self.prefix, name), seconds, labels)
+
+    def flush(self):
+        lines = []
+        for name in OrderedDict.fromkeys(name for name, _ in self.counters):
+            lines.append('# TYPE {} counter'.format(name))
+            for (counter_name, labels), value in self.counters.items():
+                if counter_name == name:
+                    lines.append('{}{{{}}} {}'.format(
+                        name, ','.join('{}="{}"'.format(key, label) for key, label in labels), value
+                    ))
+        # File is replaced atomically to be never read incomplete by the collector
+        tmp_path = '{}.tmp'.format(self.path)
+        with open(tmp_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        os.replace(tmp_path, self.path)
+
+
+def get_metrics_backend():
+    """
+    Returns:
+        metrics backend configured with settings GDPR_METRICS_BACKEND (import path of the backend class) and
+        GDPR_METRICS_BACKEND_OPTIONS (backend init kwargs) or None if metrics backend is not configured
+    """
+    backend_path = getattr(settings, 'GDPR_METRICS_BACKEND', None)
+    if backend_path is None:
+        return None
+    return import_string(backend_path)(**getattr(settings, 'GDPR_METRICS_BACKEND_OPTIONS', {}))
+
+
+class AnonymizationMetrics:
+    """
+    Collects metrics of the anonymized chunks per model and field. Every chunk is sent with the
+    anonymization_chunk_finished signal and to the configured metrics backend.
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend
+        self.models = OrderedDict()
+
+    def _get_model_metrics(self, label):
+        if label not in self.models:
+            self.models[label] = {
+                'rows': 0,
+                'queries': 0,
+                'query_seconds': 0.0,
+                'chunk_seconds': [],
+                'field_seconds': defaultdict(float),
+            }
+        return self.models[label]
+
+    def add_chunk(self, obj_anonymizer, rows, seconds, queries, query_seconds, field_seconds):
+        model = obj_anonymizer.Meta.model
+        label = model._meta.label_lower
+        model_metrics = self._get_model_metrics(label)
+        model_metrics['rows'] += rows
+        model_metrics['queries'] += queries
+        model_metrics['query_seconds'] += query_seconds
+        model_metrics['chunk_seconds'].append(seconds)
+        for name, field_seconds_value in field_seconds.items():
+            model_metrics['field_seconds'][name] += field_seconds_value
+
+        anonymization_chunk_finished.send(
+            sender=obj_anonymizer, model=model, rows=rows, seconds=seconds, queries=queries,
+            query_seconds=query_seconds, field_seconds=field_seconds
+        )
+        if self.backend:
+            labels = {'model': label}
+            self.backend.increment('rows', rows, labels)
+            self.backend.increment('chunks', 1, labels)
+            self.backend.increment('queries', queries, labels)
+            self.backend.timing('chunk_seconds', seconds, labels)
+            self.backend.timing('query_seconds', query_seconds, labels)
+            for name, field_seconds_value in field_seconds.items():
+                self.backend.timing('field_seconds', field_seconds_value, dict(labels, field=name))
+
+    def flush(self):
+        if self.backend:
+            self.backend.flush()
+
+    def has_consumers(self):
+        """
+        Returns:
+            True if chunk metrics are sent to the metrics backend or to receivers of the anonymization_chunk_finished
+            signal
+        """
+        return self.backend is not None or bool(anonymization_chunk_finished.receivers)
+
+    def get_report(self):
+        """
+        Returns:
+            dict with metrics of every model: rows, time, rows per second, SQL queries, time of field anonymizers and
+            chunk latency percentiles
+        """
+        report = OrderedDict()
+        for label, model_metrics in self.models.items():
+            chunk_seconds = sorted(model_metrics['chunk_seconds'])
+            seconds = sum(chunk_seconds)
+            report[label] = OrderedDict((
+                ('rows', model_metrics['rows']),
+                ('seconds', seconds),
+                ('rows_per_second', model_metrics['rows'] / seconds if seconds else None),
+                ('queries', model_metrics['queries']),
+                ('query_seconds', model_metrics['query_seconds']),
+                ('chunks', len(chunk_seconds)),
+                ('chunk_seconds', OrderedDict(
+                    ('p{}'.format(percentile), get_percentile(chunk_seconds, percentile))
+                    for percentile in (50, 90, 95, 99, 100)
+                )),
+                ('field_seconds', OrderedDict(
+                    sorted(model_metrics['field_seconds'].items(), key=lambda item: item[1], reverse=True)
+                )),
+            ))
+        return report
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import F, Func, Value
+from django.db.models.functions import Cast, Lower
+
+
+INTEGER_FIELD_TYPES = {
+    'AutoField', 'BigAutoField', 'BigIntegerField', 'IntegerField', 'PositiveIntegerField',
+    'PositiveSmallIntegerField', 'SmallIntegerField',
+}
+
+PARTIAL_INDEX_SQL = {
+    'postgresql': (
+        'CREATE INDEX gdpr_lr_active_src_int_idx ON gdpr_legalreason '
+        '(source_object_content_type_id, source_object_int_id, purpose_slug, expires_at) WHERE is_active'
+    ),
+    'sqlite': (
+        'CREATE INDEX gdpr_lr_active_src_int_idx ON gdpr_legalreason '
+        '(source_object_content_type_id, source_object_int_id, purpose_slug, expires_at) WHERE is_active = 1'
+    ),
+}
+
+
+def get_pk_internal_type(model):
+    pk_field = model._meta.pk
+    while pk_field.is_relation:
+        pk_field = pk_field.target_field
+    return pk_field.get_internal_type()
+
+
+def get_uuid_expression(vendor):
+    if vendor == 'postgresql':
+        return Cast('source_object_id', models.UUIDField())
+    # UUID is stored as 32 lower case hexadecimal digits (char(32)) in other databases
+    return Func(Lower(F('source_object_id')), Value('-'), Value(''), function='REPLACE',
+                output_field=models.UUIDField())
+
+
+def fill_source_object_keys(apps, schema_editor):
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    LegalReason = apps.get_model('gdpr', 'LegalReason')
+
+    content_type_ids = LegalReason.objects.values_list('source_object_content_type', flat=True).distinct()
+    for content_type in ContentType.objects.filter(pk__in=list(content_type_ids)):
+        try:
+            model = apps.get_model(content_type.app_label, content_type.model)
+        except LookupError:
+            continue
+
+        legal_reason_qs = LegalReason.objects.filter(source_object_content_type=content_type)
+        pk_internal_type = get_pk_internal_type(model)
+        if pk_internal_type in INTEGER_FIELD_TYPES:
+            legal_reason_qs.update(source_object_int_id=Cast('source_object_id', models.BigIntegerField()))
+        elif pk_internal_type == 'UUIDField':
+            legal_reason_qs.update(source_object_uuid_id=get_uuid_expression(schema_editor.connection.vendor))
+
+
+def create_partial_index(apps, schema_editor):
+    sql = PARTIAL_INDEX_SQL.get(schema_editor.connection.vendor)
+    if sql:
+        schema_editor.execute(sql)
+
+
+def drop_partial_index(apps, schema_editor):
+    if schema_editor.connection.vendor in PARTIAL_INDEX_SQL:
+        schema_editor.execute('DROP INDEX gdpr_lr_active_src_int_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gdpr', '0004'),
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='legalreason',
+            name='source_object_int_id',
+            field=models.BigIntegerField(blank=True, editable=False, null=True,
+                                         verbose_name='source object integer ID'),
+        ),
+        migrations.AddField(
+            model_name='legalreason',
+            name='source_object_uuid_id',
+            field=models.UUIDField(blank=True, editable=False, null=True, verbose_name='source object UUID'),
+        ),
+        migrations.RunPython(fill_source_object_keys, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='legalreason',
+            index=models.Index(fields=['source_object_content_type', 'source_object_id', 'purpose_slug', 'is_active',
+                                       'expires_at'], name='gdpr_lr_src_text_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='legalreason',
+            index=models.Index(fields=['source_object_content_type', 'source_object_int_id', 'purpose_slug',
+                                       'is_active', 'expires_at'], name='gdpr_lr_src_int_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='legalreason',
+            index=models.Index(fields=['source_object_content_type', 'source_object_uuid_id', 'purpose_slug',
+                                       'is_active', 'expires_at'], name='gdpr_lr_src_uuid_idx'),
+        ),
+        migrations.RunPython(create_partial_index, drop_partial_index),
+    ]
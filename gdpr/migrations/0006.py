@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gdpr', '0005'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AnonymizationCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='created at')),
+                ('changed_at', models.DateTimeField(auto_now=True, db_index=True, verbose_name='changed at')),
+                ('key', models.CharField(max_length=250, unique=True, verbose_name='key')),
+                ('value', models.TextField(blank=True, verbose_name='value')),
+            ],
+            options={
+                'verbose_name': 'anonymization checkpoint',
+                'verbose_name_plural': 'anonymization checkpoints',
+                'ordering': ('-created_at',),
+            },
+        ),
+    ]
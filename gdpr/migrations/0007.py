@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('gdpr', '0006'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='anonymizeddata',
+            index=models.Index(fields=['content_type', 'object_id', 'field'], name='gdpr_ad_ct_obj_field_idx'),
+        ),
+    ]
@@ -1,14 +1,69 @@
+from collections import OrderedDict, defaultdict
+
 from django.contrib.contenttypes.fields import GenericForeignKey
 from django.contrib.contenttypes.models import ContentType
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.db.models.functions import Cast
 from django.utils import timezone
 from django.utils.translation import ugettext_lazy as _
 
 from chamber.models import SmartModel
 
+from .cache import get_consent_cache
 from .purposes.default import purposes_map
 
 
+INTEGER_FIELD_TYPES = {
+    'AutoField', 'BigAutoField', 'BigIntegerField', 'IntegerField', 'PositiveIntegerField',
+    'PositiveSmallIntegerField', 'SmallIntegerField',
+}
+
+# Number of attempts to create one batch of consents when concurrent calls insert the same legal reasons
+CREATE_CONSENTS_BATCH_ATTEMPTS = 3
+
+
+def get_consent_key(purpose_slug, source_object):
+    return ContentType.objects.get_for_model(source_object.__class__).pk, str(source_object.pk), purpose_slug
+
+
+def get_source_object_key_field_name(model):
+    """
+    Returns:
+        name of the LegalReason typed source object key field that can store primary key of the model or None if
+        the primary key type is not supported (only source_object_id text field is used in this case)
+    """
+    pk_field = model._meta.pk
+    while pk_field.is_relation:
+        pk_field = pk_field.target_field
+
+    internal_type = pk_field.get_internal_type()
+    if internal_type in INTEGER_FIELD_TYPES:
+        return 'source_object_int_id'
+    elif internal_type == 'UUIDField':
+        return 'source_object_uuid_id'
+    else:
+        return None
+
+
+def get_source_object_key_filter(model, object_ids, lookup=None):
+    """
+    Returns Q that filters LegalReasons by source object primary key (or keys if the lookup is "in"). Typed source
+    object key is used if the model primary key supports it, LegalReasons without the typed key (e.g. inserted
+    without the _pre_save hook) are found by the source_object_id text field.
+    """
+    text_object_ids = [str(object_id) for object_id in object_ids] if lookup == 'in' else str(object_ids)
+    text_lookup = 'source_object_id__{}'.format(lookup) if lookup else 'source_object_id'
+    key_field_name = get_source_object_key_field_name(model)
+    if key_field_name is None:
+        return Q(**{text_lookup: text_object_ids})
+
+    key_lookup = '{}__{}'.format(key_field_name, lookup) if lookup else key_field_name
+    return Q(**{key_lookup: object_ids}) | Q(**{
+        '{}__isnull'.format(key_field_name): True, text_lookup: text_object_ids
+    })
+
+
 class LegalReasonManager(models.Manager):
 
     def create_consent(self, purpose_slug, source_object, issued_at=None, tag=None, related_objects=None):
@@ -51,8 +106,139 @@ class LegalReasonManager(models.Manager):
                 object_id=related_object.pk
             )
 
+        self._invalidate_consent_cache(purpose_slug, [source_object])
         return legal_reason
 
+    def _invalidate_consent_cache(self, purpose_slug, source_objects):
+        consent_cache = get_consent_cache()
+        if consent_cache is not None:
+            consent_cache.invalidate([get_consent_key(purpose_slug, source_object) for source_object in source_objects])
+
+    def _create_consents_batch(self, purpose_slug, source_objects, issued_at, tag, related_objects):
+        purpose = purposes_map[purpose_slug]
+        now = timezone.now()
+        source_object_keys = OrderedDict(
+            ((ContentType.objects.get_for_model(source_object.__class__).pk, str(source_object.pk)), source_object)
+            for source_object in source_objects
+        )
+
+        # Selected rows are locked (they are updated anyway), locking read returns rows committed by concurrent calls
+        legal_reasons = {
+            (legal_reason.source_object_content_type_id, legal_reason.source_object_id): legal_reason
+            for legal_reason in LegalReason.objects.filter_source_instances(source_objects).filter(
+                purpose_slug=purpose_slug
+            ).select_for_update()
+        }
+        if legal_reasons:
+            changed_data = {
+                'expires_at': now + purpose.expiration_timedelta,
+                'tag': tag,
+                'is_active': True,
+                'changed_at': now,
+            }
+            LegalReason.objects.filter(pk__in=[legal_reason.pk for legal_reason in legal_reasons.values()]).update(
+                **changed_data
+            )
+            for legal_reason in legal_reasons.values():
+                for field_name, value in changed_data.items():
+                    setattr(legal_reason, field_name, value)
+
+        created_legal_reasons = [
+            LegalReason(
+                source_object_content_type_id=content_type_id,
+                source_object_id=source_object_id,
+                purpose_slug=purpose_slug,
+                issued_at=issued_at,
+                expires_at=issued_at + purpose.expiration_timedelta,
+                tag=tag,
+                is_active=True,
+                **LegalReason.get_source_object_keys(source_object.__class__, source_object.pk)
+            )
+            for (content_type_id, source_object_id), source_object in source_object_keys.items()
+            if (content_type_id, source_object_id) not in legal_reasons
+        ]
+        if created_legal_reasons:
+            LegalReason.objects.bulk_create(created_legal_reasons)
+            if created_legal_reasons[0].pk is None:
+                # Backend doesn't return IDs of bulk created objects
+                created_legal_reasons = LegalReason.objects.filter_source_instances(
+                    [source_object_keys[(legal_reason.source_object_content_type_id, legal_reason.source_object_id)]
+                     for legal_reason in created_legal_reasons]
+                ).filter(purpose_slug=purpose_slug)
+            legal_reasons.update({
+                (legal_reason.source_object_content_type_id, legal_reason.source_object_id): legal_reason
+                for legal_reason in created_legal_reasons
+            })
+
+        related_object_keys = OrderedDict()
+        for key, source_object in source_object_keys.items():
+            for related_object in related_objects.get(source_object, ()):
+                related_object_keys[(
+                    legal_reasons[key].pk,
+                    ContentType.objects.get_for_model(related_object.__class__).pk,
+                    str(related_object.pk)
+                )] = related_object
+        if related_object_keys:
+            existing_related_objects = {
+                (legal_reason_id, object_content_type_id, object_id): pk
+                for pk, legal_reason_id, object_content_type_id, object_id in LegalReasonRelatedObject.objects.filter(
+                    legal_reason_id__in={legal_reason_id for legal_reason_id, _, _ in related_object_keys.keys()},
+                    object_content_type_id__in={content_type_id for _, content_type_id, _ in related_object_keys.keys()}
+                ).select_for_update().values_list('pk', 'legal_reason_id', 'object_content_type_id', 'object_id')
+                if (legal_reason_id, object_content_type_id, object_id) in related_object_keys
+            }
+            if existing_related_objects:
+                LegalReasonRelatedObject.objects.filter(pk__in=existing_related_objects.values()).update(changed_at=now)
+            LegalReasonRelatedObject.objects.bulk_create([
+                LegalReasonRelatedObject(
+                    legal_reason_id=legal_reason_id,
+                    object_content_type_id=object_content_type_id,
+                    object_id=object_id
+                )
+                for legal_reason_id, object_content_type_id, object_id in related_object_keys.keys()
+                if (legal_reason_id, object_content_type_id, object_id) not in existing_related_objects
+            ])
+
+        return [legal_reasons[key] for key in source_object_keys.keys()]
+
+    def create_consents(self, purpose_slug, source_objects, issued_at=None, tag=None, related_objects=None,
+                        batch_size=500):
+        """
+        Bulk variant of create_consent. LegalReasons and their related objects are created or updated with a fixed
+        number of queries per batch of source objects. Model save methods and signals are not called. Batch is
+        processed again if a concurrent call inserted some of its rows before (unique constraint is violated).
+
+        Args:
+            purpose_slug: String of Legal Reason purpose
+            source_objects: Source objects the Legal Reasons are related to (can be instances of different models)
+            issued_at: When the Legal Reason consents were given
+            tag: String that the developer can add to the created consents and use it to mark his business processes
+            related_objects: Dict of source objects and objects their Legal Reason relates to (ie. order,
+                registrations etc.)
+            batch_size: Number of source objects processed in one batch
+
+        Returns:
+            list: LegalReason objects of unique source objects in the input order
+        """
+        issued_at = issued_at or timezone.now()
+        source_objects = list(OrderedDict.fromkeys(source_objects))
+        legal_reasons = []
+        with transaction.atomic():
+            for i in range(0, len(source_objects), batch_size):
+                for attempt in range(1, CREATE_CONSENTS_BATCH_ATTEMPTS + 1):
+                    try:
+                        with transaction.atomic():
+                            legal_reasons += self._create_consents_batch(
+                                purpose_slug, source_objects[i:i + batch_size], issued_at, tag, related_objects or {}
+                            )
+                        break
+                    except IntegrityError:
+                        # Rows inserted by the concurrent call are selected and updated by the next attempt
+                        if attempt == CREATE_CONSENTS_BATCH_ATTEMPTS:
+                            raise
+        self._invalidate_consent_cache(purpose_slug, source_objects)
+        return legal_reasons
+
     def deactivate_consent(self, purpose_slug, source_object):
         """
         Deactivate/Remove consent (Leagal reason) for source_object, purpose_slug combination
@@ -63,17 +249,133 @@ class LegalReasonManager(models.Manager):
         """
         LegalReason.objects.filter_source_instance_active_non_expired(source_object).filter(
             purpose_slug=purpose_slug).update(is_active=False)
+        self._invalidate_consent_cache(purpose_slug, [source_object])
 
     def exists_valid_consent(self, purpose_slug, source_object):
         """
-        Returns True if source_object has valid (ie. active and non-expired) consent (Legal Reason)
+        Returns True if source_object has valid (ie. active and non-expired) consent (Legal Reason). Result is read
+        from the consent cache if it is enabled.
 
         Args:
             purpose_slug: Purpose_slug to check consent for
             source_object: Source object to check consent for
         """
-        return LegalReason.objects.filter_source_instance_active_non_expired(
-            source_object).filter(purpose_slug=purpose_slug).exists()
+        consent_cache = get_consent_cache()
+        if consent_cache is None:
+            return LegalReason.objects.filter_source_instance_active_non_expired(
+                source_object).filter(purpose_slug=purpose_slug).exists()
+
+        consent_key = get_consent_key(purpose_slug, source_object)
+        is_valid = consent_cache.get(consent_key)
+        if is_valid is None:
+            expires_at = LegalReason.objects.filter_source_instance_active_non_expired(
+                source_object).filter(purpose_slug=purpose_slug).values_list('expires_at', flat=True).first()
+            consent_cache.set_many({consent_key: expires_at})
+            is_valid = expires_at is not None
+        return is_valid
+
+    def exists_valid_consents(self, purpose_slugs, source_objects):
+        """
+        Bulk variant of exists_valid_consent. All combinations of purpose slugs and source objects are checked with
+        one query (only combinations missing in the consent cache if it is enabled).
+
+        Args:
+            purpose_slugs: Purpose slugs to check consents for
+            source_objects: Source objects to check consents for (can be instances of different models)
+
+        Returns:
+            dict: keys are tuples (source_object, purpose_slug), values are True if valid consent exists
+        """
+        purpose_slugs = list(purpose_slugs)
+        source_objects = list(source_objects)
+        consent_keys = OrderedDict(
+            ((source_object, purpose_slug), get_consent_key(purpose_slug, source_object))
+            for source_object in source_objects
+            for purpose_slug in purpose_slugs
+        )
+        consent_cache = get_consent_cache()
+        valid_consents = consent_cache.get_many(consent_keys.values()) if consent_cache is not None else {}
+
+        missing_consent_keys = [
+            consent_key for consent_key in consent_keys.values() if consent_key not in valid_consents
+        ]
+        if missing_consent_keys:
+            missing_source_objects = [
+                source_object for (source_object, purpose_slug), consent_key in consent_keys.items()
+                if consent_key not in valid_consents
+            ]
+            valid_consents_expires_at = {
+                (content_type_id, source_object_id, purpose_slug): expires_at
+                for content_type_id, source_object_id, purpose_slug, expires_at in
+                LegalReason.objects.filter_source_instances_active_non_expired(missing_source_objects).filter(
+                    purpose_slug__in={purpose_slug for _, _, purpose_slug in missing_consent_keys}
+                ).values_list('source_object_content_type_id', 'source_object_id', 'purpose_slug', 'expires_at')
+            }
+            if consent_cache is not None:
+                consent_cache.set_many({
+                    consent_key: valid_consents_expires_at.get(consent_key) for consent_key in missing_consent_keys
+                })
+            valid_consents.update({
+                consent_key: consent_key in valid_consents_expires_at for consent_key in missing_consent_keys
+            })
+        return {key: valid_consents[consent_key] for key, consent_key in consent_keys.items()}
+
+    def get_valid_consent_exists(self, model, purpose_slug, source_object_id_ref=None):
+        """
+        Returns correlated Exists subquery that can be used to annotate or filter queryset of the model. Subquery
+        is True for model objects with valid (ie. active and non-expired) consent.
+
+        Args:
+            model: Model of the outer queryset
+            purpose_slug: Purpose slug to check consent for
+            source_object_id_ref: Name of the outer queryset field or annotation with the object primary key
+                converted to text (source_object_id is TextField). It is required for models whose primary key
+                cannot be stored in the typed source object key, for other models LegalReasons without the typed key
+                are found with it.
+        """
+        key_field_name = get_source_object_key_field_name(model)
+        if key_field_name is None:
+            source_object_filter = Q(source_object_id=OuterRef(source_object_id_ref or 'pk'))
+        elif source_object_id_ref is None:
+            source_object_filter = Q(**{key_field_name: OuterRef('pk')})
+        else:
+            source_object_filter = Q(**{key_field_name: OuterRef('pk')}) | Q(**{
+                '{}__isnull'.format(key_field_name): True, 'source_object_id': OuterRef(source_object_id_ref)
+            })
+
+        return Exists(
+            LegalReason.objects.filter_active_and_non_expired().filter(
+                source_object_filter,
+                purpose_slug=purpose_slug,
+                source_object_content_type=ContentType.objects.get_for_model(model),
+            ).values('pk')
+        )
+
+    def annotate_valid_consent(self, qs, purpose_slug, name='has_valid_consent'):
+        """
+        Annotate every object of the queryset with boolean whether it has valid consent for the purpose.
+
+        Args:
+            qs: Queryset of source objects (of any model)
+            purpose_slug: Purpose slug to check consent for
+            name: Name of the annotation
+        """
+        # Primary key is casted in the outer query, OuterRef cannot be used inside of functions in older Django
+        return qs.annotate(_source_object_id=Cast('pk', models.TextField())).annotate(
+            **{name: self.get_valid_consent_exists(qs.model, purpose_slug, '_source_object_id')}
+        )
+
+    def filter_valid_consent(self, qs, purpose_slug):
+        """
+        Filter objects of the queryset with valid consent for the purpose with one SQL query.
+
+        Args:
+            qs: Queryset of source objects (of any model)
+            purpose_slug: Purpose slug to check consent for
+        """
+        # Exists expression must be annotated before it can be used in the filter
+        name = '_has_valid_consent_{}'.format(purpose_slug.replace('-', '_'))
+        return self.annotate_valid_consent(qs, purpose_slug, name).filter(**{name: True})
 
 
 class LegalReasonQuerySet(models.QuerySet):
@@ -85,12 +387,29 @@ class LegalReasonQuerySet(models.QuerySet):
         return self.filter(is_active=True).filter_non_expired()
 
     def filter_source_instance(self, source_object):
-        return self.filter(source_object_content_type=ContentType.objects.get_for_model(source_object.__class__),
-                           source_object_id=str(source_object.pk))
+        return self.filter(
+            get_source_object_key_filter(source_object.__class__, source_object.pk),
+            source_object_content_type=ContentType.objects.get_for_model(source_object.__class__)
+        )
+
+    def filter_source_instances(self, source_objects):
+        source_object_ids = OrderedDict()
+        for source_object in source_objects:
+            source_object_ids.setdefault(source_object.__class__, set()).add(source_object.pk)
+
+        q = Q()
+        for model, object_ids in source_object_ids.items():
+            q |= Q(source_object_content_type=ContentType.objects.get_for_model(model)) & get_source_object_key_filter(
+                model, object_ids, 'in'
+            )
+        return self.filter(q) if q else self.none()
 
     def filter_source_instance_active_non_expired(self, source_object):
         return self.filter_source_instance(source_object).filter_active_and_non_expired()
 
+    def filter_source_instances_active_non_expired(self, source_objects):
+        return self.filter_source_instances(source_objects).filter_active_and_non_expired()
+
 
 class LegalReason(SmartModel):
 
@@ -140,11 +459,43 @@ class LegalReason(SmartModel):
     source_object = GenericForeignKey(
         'source_object_content_type', 'source_object_id'
     )
+    source_object_int_id = models.BigIntegerField(
+        verbose_name=_('source object integer ID'),
+        null=True,
+        blank=True,
+        editable=False
+    )
+    source_object_uuid_id = models.UUIDField(
+        verbose_name=_('source object UUID'),
+        null=True,
+        blank=True,
+        editable=False
+    )
 
     @property
     def purpose(self):
         return purposes_map.get(self.purpose_slug, None)
 
+    @staticmethod
+    def get_source_object_keys(model, object_id):
+        """
+        Returns:
+            dict with values of typed source object keys for the object of the model
+        """
+        key_field_name = get_source_object_key_field_name(model)
+        return {
+            field_name: LegalReason._meta.get_field(field_name).to_python(object_id)
+            if field_name == key_field_name else None
+            for field_name in ('source_object_int_id', 'source_object_uuid_id')
+        }
+
+    def _pre_save(self, *args, **kwargs):
+        super()._pre_save(*args, **kwargs)
+        model = ContentType.objects.get_for_id(self.source_object_content_type_id).model_class()
+        if model is not None:
+            for field_name, value in self.get_source_object_keys(model, self.source_object_id).items():
+                setattr(self, field_name, value)
+
     def __str__(self):
         return '{purpose_slug}'.format(purpose_slug=self.get_purpose_slug_display())
 
@@ -153,6 +504,14 @@ class LegalReason(SmartModel):
         verbose_name_plural = _('legal reasons')
         ordering = ('-created_at',)
         unique_together = ('purpose_slug', 'source_object_content_type', 'source_object_id')
+        indexes = [
+            models.Index(fields=['source_object_content_type', 'source_object_id', 'purpose_slug', 'is_active',
+                                 'expires_at'], name='gdpr_lr_src_text_idx'),
+            models.Index(fields=['source_object_content_type', 'source_object_int_id', 'purpose_slug', 'is_active',
+                                 'expires_at'], name='gdpr_lr_src_int_idx'),
+            models.Index(fields=['source_object_content_type', 'source_object_uuid_id', 'purpose_slug', 'is_active',
+                                 'expires_at'], name='gdpr_lr_src_uuid_idx'),
+        ]
 
 
 class LegalReasonRelatedObject(SmartModel):
@@ -189,8 +548,72 @@ class LegalReasonRelatedObject(SmartModel):
         unique_together = ('legal_reason', 'object_content_type', 'object_id')
 
 
+class AnonymizedDataManager(models.Manager):
+
+    def create_anonymized_data(self, model, object_ids, field_names, expired_reasons=None, batch_size=None):
+        """
+        Bulk create AnonymizedData for every combination of object and field.
+
+        Args:
+            model: Model of anonymized objects
+            object_ids: Primary keys of anonymized objects
+            field_names: Names of anonymized fields
+            expired_reasons: Dict of object primary keys and IDs of LegalReasons whose expiration caused the
+                anonymization
+            batch_size: Number of objects created with one query, the maximal size supported by the database is
+                used by default
+
+        Returns:
+            list: created AnonymizedData objects
+        """
+        content_type = ContentType.objects.get_for_model(model)
+        expired_reasons = expired_reasons or {}
+        return self.bulk_create(
+            [
+                AnonymizedData(
+                    field=field_name,
+                    content_type=content_type,
+                    object_id=str(object_id),
+                    expired_reason_id=expired_reasons.get(object_id)
+                )
+                for object_id in object_ids
+                for field_name in field_names
+            ],
+            batch_size=batch_size
+        )
+
+    def get_anonymized_fields(self, model, object_ids, field_names=None, batch_size=500):
+        """
+        Batch lookup of anonymized fields recorded as AnonymizedData.
+
+        Args:
+            model: Model of the objects
+            object_ids: Primary keys of the objects
+            field_names: Only these fields are checked, all fields by default
+            batch_size: Number of object IDs checked with one query
+
+        Returns:
+            dict: object primary keys (from object_ids) and sets of anonymized field names, objects without anonymized
+                fields are not included
+        """
+        object_ids = OrderedDict((str(object_id), object_id) for object_id in object_ids)
+        qs = self.filter(content_type=ContentType.objects.get_for_model(model), is_active=True)
+        if field_names is not None:
+            qs = qs.filter(field__in=list(field_names))
+
+        anonymized_fields = defaultdict(set)
+        str_object_ids = list(object_ids.keys())
+        for i in range(0, len(str_object_ids), batch_size):
+            for object_id, field_name in qs.filter(object_id__in=str_object_ids[i:i + batch_size]).values_list(
+                    'object_id', 'field'):
+                anonymized_fields[object_ids[object_id]].add(field_name)
+        return dict(anonymized_fields)
+
+
 class AnonymizedData(SmartModel):
 
+    objects = AnonymizedDataManager()
+
     field = models.CharField(
         verbose_name=_('anonymized field name'),
         max_length=250,
@@ -229,3 +652,51 @@ class AnonymizedData(SmartModel):
         verbose_name = _('anonymized data')
         verbose_name_plural = _('anonymized data')
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['content_type', 'object_id', 'field'], name='gdpr_ad_ct_obj_field_idx'),
+        ]
+
+
+class AnonymizationCheckpointManager(models.Manager):
+
+    def get_value(self, key, default=None):
+        """
+        Returns:
+            Stored value of the checkpoint with the key or default if checkpoint doesn't exist
+        """
+        value = self.filter(key=key).values_list('value', flat=True).first()
+        return default if value is None else value
+
+    def set_value(self, key, value):
+        # QuerySet.update doesn't set auto_now fields
+        if not self.filter(key=key).update(value=value, changed_at=timezone.now()):
+            self.create(key=key, value=value)
+
+
+class AnonymizationCheckpoint(SmartModel):
+    """
+    Persistent state of incremental or resumable anonymization runs (ie. watermark of processed data).
+    """
+
+    objects = AnonymizationCheckpointManager()
+
+    key = models.CharField(
+        verbose_name=_('key'),
+        max_length=250,
+        null=False,
+        blank=False,
+        unique=True
+    )
+    value = models.TextField(
+        verbose_name=_('value'),
+        null=False,
+        blank=True
+    )
+
+    def __str__(self):
+        return '{key}: {value}'.format(key=self.key, value=self.value)
+
+    class Meta:
+        verbose_name = _('anonymization checkpoint')
+        verbose_name_plural = _('anonymization checkpoints')
+        ordering = ('-created_at',)
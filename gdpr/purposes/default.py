@@ -29,3 +29,17 @@ class AbstractPurpose(metaclass=PurposeMetaclass):
     slug = None
     fields = {}
     expiration_timedelta = timedelta()
+
+    @classmethod
+    def get_model_fields(cls, model):
+        """
+        Purpose fields are defined as dict whose keys are models or model labels ("app_label.ModelName") and values
+        are names of the model fields.
+
+        Returns:
+            set of names of the model fields the purpose is related to
+        """
+        for key, field_names in cls.fields.items():
+            if key is model or (isinstance(key, str) and key.lower() == model._meta.label_lower):
+                return set(field_names)
+        return set()
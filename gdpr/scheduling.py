@@ -0,0 +1,199 @@
+from collections import OrderedDict, defaultdict
+
+from itertools import zip_longest
+
+from django.apps import apps
+from django.contrib.contenttypes.fields import GenericRelation
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import CASCADE, Q
+
+from .anonymizers import DeleteModelAnonymizer
+
+
+def is_foreign_key(field):
+    return field.is_relation and field.concrete and (field.many_to_one or field.one_to_one)
+
+
+def is_cascade_foreign_key(field):
+    return is_foreign_key(field) and field.remote_field.on_delete is CASCADE
+
+
+def get_generic_relations():
+    """
+    Returns:
+        dict of models and list of tuples (owner model, content type field name) of generic relations whose objects
+        are deleted with the owner model objects
+    """
+    generic_relations = defaultdict(list)
+    for model in apps.get_models():
+        for field in model._meta.private_fields:
+            if isinstance(field, GenericRelation):
+                generic_relations[field.related_model].append((model, field.content_type_field_name))
+    return generic_relations
+
+
+def get_topological_order(models, parents):
+    """
+    Args:
+        models: ordered models
+        parents: dict of models and sets of models they depend on
+
+    Returns:
+        list of models ordered that parents precede their children, cyclic dependencies are resolved in the order of
+        models
+    """
+    ordered_models = []
+    remaining_models = list(models)
+    while remaining_models:
+        ready_models = [model for model in remaining_models if not (parents[model] & set(remaining_models))]
+        ready_models = ready_models or remaining_models[:1]
+        ordered_models += ready_models
+        remaining_models = [model for model in remaining_models if model not in ready_models]
+    return ordered_models
+
+
+class AnonymizationSchedule:
+    """
+    Schedule of model anonymizers according to the dependency graph built from ForeignKey relations and generic
+    relations (GenericForeignKey with GenericRelation on the owner model) of the anonymized models.
+
+    Model depends on the anonymized model that it references directly or through a chain of CASCADE relations of not
+    anonymized models. Models with DeleteModelAnonymizer delete the whole table therefore rows that would be deleted by
+    the cascade are not anonymized by the other anonymizers. Deletes are scheduled child first (every delete removes
+    only its own rows without the cascade) and updates are scheduled after deletes in the topological order. Models
+    without dependencies form independent components which can be anonymized concurrently.
+    """
+
+    def __init__(self, obj_anonymizers):
+        self.obj_anonymizers = OrderedDict((obj_anonymizer.Meta.model, obj_anonymizer)
+                                           for obj_anonymizer in obj_anonymizers)
+        self.deleted_models = {
+            model for model, obj_anonymizer in self.obj_anonymizers.items()
+            if issubclass(obj_anonymizer, DeleteModelAnonymizer)
+        }
+        self.generic_relations = get_generic_relations()
+        self.parents = OrderedDict((model, self._get_parent_models(model)) for model in self.obj_anonymizers)
+
+    def _get_parent_models(self, model):
+        parents = set()
+        visited = {model}
+        stack = [model]
+        while stack:
+            current_model = stack.pop()
+            for field in current_model._meta.concrete_fields:
+                if not is_foreign_key(field):
+                    continue
+
+                related_model = field.related_model
+                if related_model in self.obj_anonymizers:
+                    if related_model is not model and (current_model is model or is_cascade_foreign_key(field)):
+                        parents.add(related_model)
+                elif is_cascade_foreign_key(field) and related_model not in visited:
+                    visited.add(related_model)
+                    stack.append(related_model)
+        for owner_model, _ in self.generic_relations.get(model, ()):
+            if owner_model in self.obj_anonymizers and owner_model is not model:
+                parents.add(owner_model)
+        return parents
+
+    def _get_surviving_filter(self, model, prefix='', visited=()):
+        """
+        Returns:
+            Q of rows that will not be deleted by the cascade, None if all rows survive, False if all rows are deleted
+        """
+        if model in self.deleted_models:
+            return False
+
+        conditions = []
+        for field in model._meta.concrete_fields:
+            if not is_cascade_foreign_key(field) or field.related_model in visited or field.related_model is model:
+                continue
+
+            lookup = '{}{}'.format(prefix, field.name)
+            parent_filter = self._get_surviving_filter(field.related_model, '{}__'.format(lookup), visited + (model,))
+            if parent_filter is False:
+                conditions.append(Q(**{'{}__isnull'.format(lookup): True}))
+            elif parent_filter is not None:
+                conditions.append(Q(**{'{}__isnull'.format(lookup): True}) | parent_filter)
+
+        if not prefix:
+            # Objects of generic relations are deleted with their owners, joins over generic relations are not followed
+            for owner_model, content_type_field_name in self.generic_relations.get(model, ()):
+                if owner_model in self.deleted_models:
+                    conditions.append(~Q(**{content_type_field_name: ContentType.objects.get_for_model(owner_model)}))
+
+        if not conditions:
+            return None
+        surviving_filter = conditions[0]
+        for condition in conditions[1:]:
+            surviving_filter &= condition
+        return surviving_filter
+
+    def get_model_filter(self, model):
+        """
+        Returns:
+            Q of model rows that are not deleted by the anonymization (by DeleteModelAnonymizer or its cascade), None
+            if all rows are kept, False if all rows are deleted
+        """
+        return self._get_surviving_filter(model)
+
+    def get_filter(self, obj_anonymizer):
+        """
+        Returns:
+            Q of model rows that should be anonymized by the anonymizer (rows which will be deleted by the cascade of
+            a deleted model are excluded) or None if all rows should be anonymized
+        """
+        if obj_anonymizer.Meta.model in self.deleted_models:
+            return None
+
+        return self._get_surviving_filter(obj_anonymizer.Meta.model)
+
+    def get_queryset(self, obj_anonymizer):
+        qs = obj_anonymizer.Meta.model.objects.all()
+        qs_filter = self.get_filter(obj_anonymizer)
+        return qs if qs_filter is None else qs.filter(qs_filter)
+
+    def get_components(self):
+        """
+        Returns:
+            list of independent components, every component is list of anonymizers in the order of anonymization
+            (deletes child first, then updates parent first)
+        """
+        component_roots = OrderedDict((model, model) for model in self.obj_anonymizers)
+
+        def find_root(model):
+            while component_roots[model] is not model:
+                model = component_roots[model]
+            return model
+
+        for model, parents in self.parents.items():
+            for parent in parents:
+                component_roots[find_root(model)] = find_root(parent)
+
+        components = OrderedDict()
+        for model in self.obj_anonymizers:
+            components.setdefault(find_root(model), []).append(model)
+
+        ordered_components = []
+        for models in components.values():
+            # Cyclic dependencies are resolved in the registration order
+            ordered_models = get_topological_order(models, self.parents)
+            ordered_components.append(
+                [self.obj_anonymizers[model] for model in reversed(ordered_models) if model in self.deleted_models] +
+                [self.obj_anonymizers[model] for model in ordered_models if model not in self.deleted_models]
+            )
+        return ordered_components
+
+    def get_ordered_anonymizers(self):
+        return [obj_anonymizer for component in self.get_components() for obj_anonymizer in component]
+
+    def get_stages(self):
+        """
+        Returns:
+            list of stages, stage contains at most one anonymizer of every component, anonymizers of one stage are
+            independent and can run concurrently
+        """
+        return [
+            [obj_anonymizer for obj_anonymizer in stage if obj_anonymizer is not None]
+            for stage in zip_longest(*self.get_components())
+        ]
@@ -0,0 +1,13 @@
+from django.dispatch import Signal
+
+
+# Sent after every anonymized chunk of the anonymize_data command, sender is the model anonymizer class
+#   model: anonymized model
+#   rows: number of anonymized rows
+#   seconds: wall time of the chunk
+#   queries: number of executed SQL queries
+#   query_seconds: time spent in SQL queries
+#   field_seconds: dict of field names and time spent in their field anonymizers
+anonymization_chunk_finished = Signal(
+    providing_args=['model', 'rows', 'seconds', 'queries', 'query_seconds', 'field_seconds']
+)
@@ -0,0 +1,236 @@
+from collections import OrderedDict, defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import Q
+
+from .anonymizers import DeleteModelAnonymizer
+from .loading import get_anonymizer, register
+from .models import LegalReason, LegalReasonRelatedObject
+from .scheduling import AnonymizationSchedule, is_foreign_key
+
+
+def get_referencing_models():
+    return [obj_anonymizer.Meta.model for obj_anonymizer in register.get_anonymizers()]
+
+
+def get_referencing_object_ids(object_ids, models=None):
+    """
+    Args:
+        object_ids: dict of models and sets of primary keys of the referenced objects
+        models: referencing models, models with registered anonymizer are used by default
+
+    Returns:
+        dict of models and sets of primary keys of their objects that reference some of the objects with ForeignKey,
+        one query per model
+    """
+    referencing_object_ids = OrderedDict()
+    for model in (get_referencing_models() if models is None else models):
+        q = Q()
+        for field in model._meta.concrete_fields:
+            if is_foreign_key(field) and object_ids.get(field.related_model):
+                q |= Q(**{'{}__in'.format(field.name): object_ids[field.related_model]})
+        if q:
+            referencing_object_ids[model] = set(model.objects.filter(q).values_list('pk', flat=True))
+    return referencing_object_ids
+
+
+def add_referencing_object_ids(object_ids, new_object_ids, models=None):
+    """
+    Adds objects of the models with registered anonymizer (or of the models) that reference the new objects directly
+    or through other referencing objects. References are followed until no new objects are found, every round queries
+    only the newly found objects.
+
+    Args:
+        object_ids: dict (defaultdict of sets) of models and sets of primary keys which is updated
+        new_object_ids: dict of models and sets of primary keys whose references are followed
+        models: referencing models, models with registered anonymizer are used by default
+    """
+    while new_object_ids:
+        referencing_object_ids = get_referencing_object_ids(new_object_ids, models)
+        new_object_ids = {}
+        for model, model_object_ids in referencing_object_ids.items():
+            model_new_object_ids = model_object_ids - object_ids[model]
+            if model_new_object_ids:
+                object_ids[model].update(model_new_object_ids)
+                new_object_ids[model] = model_new_object_ids
+
+
+def get_related_object_ids(source_object):
+    """
+    Returns:
+        dict of models and sets of primary keys of the related objects of the source object LegalReasons
+    """
+    related_object_ids = defaultdict(set)
+    for content_type_id, object_id in LegalReasonRelatedObject.objects.filter(
+            legal_reason__in=LegalReason.objects.filter_source_instance(source_object)).values_list(
+                'object_content_type_id', 'object_id').distinct():
+        model = ContentType.objects.get_for_id(content_type_id).model_class()
+        if model is not None:
+            related_object_ids[model].add(model._meta.pk.to_python(object_id))
+    return related_object_ids
+
+
+def iterate_subject_querysets(source_object, follow_related_objects=False):
+    """
+    Iterate over querysets of the subject objects per model (objects are described in get_subject_object_ids).
+    Queryset of the model selects objects that reference the subject objects with subqueries of the referenced models
+    querysets, primary keys are loaded only for models with cyclic references. Subject objects can be therefore
+    streamed per model without collecting all their primary keys in memory. Referenced models precede models that
+    reference them.
+
+    Args:
+        source_object: Source object of the subject LegalReasons (e.g. customer or user)
+        follow_related_objects: objects that reference related objects of the LegalReasons are subject objects too
+
+    Returns:
+        generator of tuples (model, queryset of the subject objects)
+    """
+    related_object_ids = get_related_object_ids(source_object)
+    followed_object_ids = defaultdict(set)
+    followed_object_ids[source_object.__class__].add(source_object.pk)
+    if follow_related_objects:
+        for model, model_object_ids in related_object_ids.items():
+            followed_object_ids[model].update(model_object_ids)
+        related_object_ids = {}
+
+    referencing_models = get_referencing_models()
+    models = list(OrderedDict.fromkeys(list(followed_object_ids) + referencing_models))
+    foreign_keys = {
+        model: [
+            field for field in model._meta.concrete_fields if is_foreign_key(field) and field.related_model in models
+        ] if model in referencing_models else []
+        for model in models
+    }
+
+    def get_subject_filter(model):
+        q = Q(pk__in=followed_object_ids[model]) if followed_object_ids.get(model) else Q()
+        for field in foreign_keys[model]:
+            if field.related_model in subject_querysets:
+                q |= Q(**{'{}__in'.format(field.name): subject_querysets[field.related_model].values(
+                    field.target_field.name
+                )})
+        return q
+
+    def get_referenced_models(model):
+        referenced_models = set()
+        stack = [model]
+        while stack:
+            for field in foreign_keys[stack.pop()]:
+                if field.related_model in remaining_models and field.related_model not in referenced_models:
+                    referenced_models.add(field.related_model)
+                    stack.append(field.related_model)
+        return referenced_models
+
+    subject_querysets = {}
+    remaining_models = models
+    while remaining_models:
+        ready_models = [
+            model for model in remaining_models
+            if not any(field.related_model in remaining_models for field in foreign_keys[model])
+        ]
+        if ready_models:
+            model = ready_models[0]
+            q = get_subject_filter(model)
+            group_querysets = {model: model.objects.filter(q)} if q else {}
+            remaining_models = [remaining_model for remaining_model in remaining_models if remaining_model is not model]
+        else:
+            # Models of a reference cycle (including a reference to the same model) which doesn't depend on other
+            # remaining models are resolved together by rounds that load primary keys
+            cycle_models = min((get_referenced_models(model) for model in remaining_models), key=len)
+            cycle_models = [model for model in remaining_models if model in cycle_models]
+            object_ids = defaultdict(set)
+            for model in cycle_models:
+                q = get_subject_filter(model)
+                if q:
+                    object_ids[model].update(model.objects.filter(q).values_list('pk', flat=True))
+            add_referencing_object_ids(object_ids, dict(object_ids), cycle_models)
+            group_querysets = OrderedDict(
+                (model, model.objects.filter(pk__in=object_ids[model])) for model in cycle_models if object_ids[model]
+            )
+            remaining_models = [model for model in remaining_models if model not in cycle_models]
+
+        for model, qs in group_querysets.items():
+            subject_querysets[model] = qs
+            if related_object_ids.get(model):
+                qs = model.objects.filter(Q(pk__in=qs.values('pk')) | Q(pk__in=related_object_ids.pop(model)))
+            yield model, qs
+
+    for model, model_object_ids in related_object_ids.items():
+        yield model, model.objects.filter(pk__in=model_object_ids)
+
+
+def get_subject_object_ids(source_object, follow_related_objects=False):
+    """
+    Collects objects of the subject: the source object, objects of the models with registered anonymizer that
+    reference the source object directly or through other subject objects and related objects of its LegalReasons.
+    Related object can be shared by more subjects (e.g. campaign or event) therefore objects that reference it belong
+    to the subject only if follow_related_objects is True.
+
+    Args:
+        source_object: Source object of the subject LegalReasons (e.g. customer or user)
+        follow_related_objects: objects that reference related objects of the LegalReasons are collected too
+
+    Returns:
+        dict of models and sets of primary keys of the subject objects
+    """
+    object_ids = defaultdict(set)
+    for model, qs in iterate_subject_querysets(source_object, follow_related_objects=follow_related_objects):
+        model_object_ids = set(qs.values_list('pk', flat=True))
+        if model_object_ids:
+            object_ids[model].update(model_object_ids)
+    return object_ids
+
+
+def deactivate_legal_reasons(source_object):
+    """
+    Deactivate all active LegalReasons of the source object and invalidate their cached consents.
+    """
+    legal_reasons_qs = LegalReason.objects.filter_source_instance(source_object).filter(is_active=True)
+    purpose_slugs = set(legal_reasons_qs.values_list('purpose_slug', flat=True))
+    legal_reasons_qs.update(is_active=False)
+    for purpose_slug in purpose_slugs:
+        LegalReason.objects._invalidate_consent_cache(purpose_slug, [source_object])
+
+
+def forget_subject(source_object, keep_legal_reasons=False, batch_size=500, follow_related_objects=False):
+    """
+    Anonymize all data of one subject ("right to be forgotten"). Objects of the subject are found with its
+    LegalReasons, LegalReasonRelatedObjects and ForeignKeys of the registered anonymizer models (see
+    get_subject_object_ids). Objects are anonymized by their model anonymizers in the dependency order with queries
+    batched per model, not per object. Everything runs in one transaction.
+
+    Args:
+        source_object: Source object of the subject LegalReasons (e.g. customer or user)
+        keep_legal_reasons: LegalReasons of the subject are deactivated unless it is True
+        batch_size: Number of objects loaded and anonymized with one query
+        follow_related_objects: objects that reference related objects of the LegalReasons are anonymized too
+
+    Returns:
+        dict of model labels and numbers of anonymized objects
+    """
+    with transaction.atomic():
+        subject_object_ids = get_subject_object_ids(source_object, follow_related_objects=follow_related_objects)
+        schedule = AnonymizationSchedule(
+            obj_anonymizer for obj_anonymizer in (get_anonymizer(model) for model in subject_object_ids)
+            if obj_anonymizer is not None
+        )
+        if not keep_legal_reasons:
+            deactivate_legal_reasons(source_object)
+
+        anonymized_counts = OrderedDict()
+        for obj_anonymizer in schedule.get_ordered_anonymizers():
+            model = obj_anonymizer.Meta.model
+            anonymizer = obj_anonymizer()
+            object_ids = list(subject_object_ids[model])
+            anonymized_count = 0
+            for i in range(0, len(object_ids), batch_size):
+                qs = model.objects.filter(pk__in=object_ids[i:i + batch_size])
+                if isinstance(anonymizer, DeleteModelAnonymizer):
+                    anonymized_count += anonymizer.anonymize_qs(qs)
+                else:
+                    objs = list(anonymizer.get_rows(qs))
+                    anonymizer.anonymize_batch(objs)
+                    anonymized_count += len(objs)
+            anonymized_counts[model._meta.label_lower] = anonymized_count
+        return anonymized_counts
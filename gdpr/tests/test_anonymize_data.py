@@ -0,0 +1,101 @@
+from io import StringIO
+from unittest import mock
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management import CommandError, call_command
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from gdpr.anonymizers import MD5TextFieldAnonymizer, ModelAnonymizer
+from gdpr.loading import register
+from gdpr.management.commands.anonymize_data import get_checkpoint_pk, set_checkpoint_pk
+from gdpr.models import LegalReason
+
+
+class InlinePool:
+    """
+    Process pool replacement that runs tasks in the current process, workers therefore see the test database.
+    """
+
+    def __init__(self, processes, initializer=None, initargs=()):
+        if initializer is not None:
+            initializer(*initargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        pass
+
+    def imap_unordered(self, function, iterable):
+        return map(function, iterable)
+
+
+class AnonymizeDataResumeTestCase(TransactionTestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        class LegalReasonTagAnonymizer(ModelAnonymizer):
+            chunk_size = 2
+            tag = MD5TextFieldAnonymizer()
+
+            class Meta:
+                model = LegalReason
+
+        cls.obj_anonymizer = LegalReasonTagAnonymizer
+
+    @classmethod
+    def tearDownClass(cls):
+        register.anonymizers.pop(LegalReason, None)
+        super().tearDownClass()
+
+    def _create_legal_reasons(self):
+        now = timezone.now()
+        LegalReason.objects.bulk_create([
+            LegalReason(
+                issued_at=now, expires_at=now, tag='tag{}'.format(i), purpose_slug='test',
+                source_object_content_type=ContentType.objects.get_for_model(LegalReason), source_object_id=str(i)
+            )
+            for i in range(7)
+        ])
+        return list(LegalReason.objects.order_by('pk'))
+
+    def test_resume_with_workers_should_not_anonymize_rows_before_checkpoint(self):
+        legal_reasons = self._create_legal_reasons()
+        set_checkpoint_pk(self.obj_anonymizer, legal_reasons[2].pk)
+
+        with mock.patch('gdpr.management.commands.anonymize_data.Pool', InlinePool):
+            call_command('anonymize_data', models='gdpr.legalreason', workers=2, resume=True, stdout=StringIO())
+
+        tags = list(LegalReason.objects.order_by('pk').values_list('tag', flat=True))
+        self.assertEqual(tags[:3], [legal_reason.tag for legal_reason in legal_reasons[:3]])
+        self.assertEqual(
+            tags[3:],
+            [MD5TextFieldAnonymizer().get_anonymized_value(legal_reason.tag) for legal_reason in legal_reasons[3:]]
+        )
+
+    def test_adaptive_chunk_size_with_workers_should_raise_command_error(self):
+        with self.assertRaises(CommandError):
+            call_command('anonymize_data', models='gdpr.legalreason', workers=2, adaptive=True, stdout=StringIO())
+
+    def _assert_resume_after_completed_run_should_not_skip_rows(self, workers):
+        legal_reasons = self._create_legal_reasons()
+        with mock.patch('gdpr.management.commands.anonymize_data.Pool', InlinePool):
+            call_command('anonymize_data', models='gdpr.legalreason', workers=workers, resume=False, stdout=StringIO())
+            self.assertIsNone(get_checkpoint_pk(self.obj_anonymizer))
+
+            LegalReason.objects.filter(pk=legal_reasons[0].pk).update(tag=legal_reasons[0].tag)
+            call_command('anonymize_data', models='gdpr.legalreason', workers=workers, resume=True, stdout=StringIO())
+
+        self.assertEqual(
+            LegalReason.objects.get(pk=legal_reasons[0].pk).tag,
+            MD5TextFieldAnonymizer().get_anonymized_value(legal_reasons[0].tag)
+        )
+
+    def test_resume_after_completed_run_should_not_skip_rows(self):
+        self._assert_resume_after_completed_run_should_not_skip_rows(workers=1)
+
+    def test_resume_with_workers_after_completed_run_should_not_skip_rows(self):
+        self._assert_resume_after_completed_run_should_not_skip_rows(workers=2)
@@ -0,0 +1,262 @@
+import hashlib
+
+from collections import defaultdict, namedtuple
+from datetime import timedelta
+from unittest.mock import patch
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
+from django.db.models.signals import pre_delete
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from gdpr.anonymizers import (
+    DeleteModelAnonymizer, EmailFieldAnonymizer, FieldAnonymizer, MD5TextFieldAnonymizer, ModelAnonymizer,
+    NameFieldAnonymizer, PersonalIIDFieldAnonymizer, PhoneFieldAnonymizer, StaticValueAnonymizer
+)
+from gdpr.cache import LRUCache
+from gdpr.functions import MD5
+from gdpr.loading import register
+from gdpr.models import AnonymizationCheckpoint, AnonymizedData, LegalReason, LegalReasonRelatedObject
+
+
+Row = namedtuple('Row', ('value',))
+
+
+class FieldAnonymizerCacheTestCase(SimpleTestCase):
+
+    def test_differently_configured_anonymizers_should_not_share_cached_values(self):
+        cache = LRUCache(10)
+        rows = [Row('original')]
+        self.assertEqual(StaticValueAnonymizer('first', cache=cache).get_anonymized_values_from_objs(rows, 'value'),
+                         ['first'])
+        self.assertEqual(StaticValueAnonymizer('second', cache=cache).get_anonymized_values_from_objs(rows, 'value'),
+                         ['second'])
+
+    def test_unhashable_values_should_be_anonymized_without_cache(self):
+        class KeysAnonymizer(FieldAnonymizer):
+
+            def get_anonymized_value(self, value):
+                return sorted(value) if isinstance(value, dict) else value.upper()
+
+        anonymizer = KeysAnonymizer(cache=10)
+        rows = [Row({'b': 1, 'a': 2}), Row('x'), Row('x'), Row({'c': 3})]
+        self.assertEqual(anonymizer.get_anonymized_values_from_objs(rows, 'value'), [['a', 'b'], 'X', 'X', ['c']])
+        self.assertEqual(len(anonymizer.cache), 1)
+
+
+class DeleteModelAnonymizerTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        class LegalReasonDeleteAnonymizer(DeleteModelAnonymizer):
+            fast_delete = True
+            truncate_vendors = {connection.vendor}
+
+            class Meta:
+                model = LegalReason
+
+        class AnonymizationCheckpointDeleteAnonymizer(DeleteModelAnonymizer):
+            fast_delete = True
+            truncate_vendors = {connection.vendor}
+
+            class Meta:
+                model = AnonymizationCheckpoint
+
+        cls.legal_reason_anonymizer = LegalReasonDeleteAnonymizer
+        cls.checkpoint_anonymizer = AnonymizationCheckpointDeleteAnonymizer
+
+    @classmethod
+    def tearDownClass(cls):
+        register.anonymizers.pop(LegalReason, None)
+        register.anonymizers.pop(AnonymizationCheckpoint, None)
+        super().tearDownClass()
+
+    def _create_legal_reason(self, source_object_id):
+        now = timezone.now()
+        content_type = ContentType.objects.get_for_model(LegalReason)
+        legal_reason = LegalReason.objects.create(
+            purpose_slug='delete-test', issued_at=now, expires_at=now + timedelta(days=1),
+            source_object_content_type=content_type, source_object_id=source_object_id
+        )
+        LegalReasonRelatedObject.objects.create(
+            legal_reason=legal_reason, object_content_type=content_type, object_id=source_object_id
+        )
+        AnonymizedData.objects.create(
+            field='tag', content_type=content_type, object_id=source_object_id, expired_reason=legal_reason
+        )
+        return legal_reason
+
+    def test_model_with_incoming_foreign_keys_should_not_be_truncated(self):
+        self.assertTrue(self.legal_reason_anonymizer().can_fast_delete())
+        self.assertFalse(self.legal_reason_anonymizer().can_truncate(LegalReason.objects.all()))
+
+    def test_only_whole_table_without_incoming_foreign_keys_should_be_truncated(self):
+        anonymizer = self.checkpoint_anonymizer()
+        self.assertTrue(anonymizer.can_truncate(AnonymizationCheckpoint.objects.all()))
+        self.assertFalse(anonymizer.can_truncate(AnonymizationCheckpoint.objects.filter(key='key')))
+
+    def test_fast_delete_should_delete_cascade_before_deleted_rows(self):
+        deleted_legal_reason = self._create_legal_reason('1')
+        kept_legal_reason = self._create_legal_reason('2')
+
+        with CaptureQueriesContext(connection) as queries:
+            deleted_count = self.legal_reason_anonymizer().anonymize_qs(
+                LegalReason.objects.filter(pk=deleted_legal_reason.pk)
+            )
+
+        self.assertEqual(deleted_count, 1)
+        self.assertEqual(list(LegalReason.objects.values_list('pk', flat=True)), [kept_legal_reason.pk])
+        self.assertEqual(list(LegalReasonRelatedObject.objects.values_list('legal_reason', flat=True)),
+                         [kept_legal_reason.pk])
+        self.assertEqual(list(AnonymizedData.objects.values_list('expired_reason', flat=True)),
+                         [kept_legal_reason.pk])
+        # Raw deletes without loading the rows, rows referencing the deleted rows are deleted first
+        deleted_tables = [
+            query['sql'].split()[2].strip('"`') for query in queries.captured_queries
+            if query['sql'].startswith('DELETE')
+        ]
+        self.assertEqual(len(deleted_tables), 3)
+        self.assertEqual(deleted_tables[-1], LegalReason._meta.db_table)
+        self.assertFalse(any(query['sql'].startswith('SELECT') for query in queries.captured_queries))
+
+    def test_delete_signal_receivers_should_disable_fast_delete(self):
+        deleted_related_objects = []
+
+        def receiver(instance, **kwargs):
+            deleted_related_objects.append(instance.pk)
+
+        legal_reason = self._create_legal_reason('1')
+        related_object = LegalReasonRelatedObject.objects.get()
+        pre_delete.connect(receiver, sender=LegalReasonRelatedObject)
+        try:
+            anonymizer = self.legal_reason_anonymizer()
+            self.assertFalse(anonymizer.can_fast_delete())
+            self.assertEqual(anonymizer.anonymize_qs(LegalReason.objects.filter(pk=legal_reason.pk)), 1)
+        finally:
+            pre_delete.disconnect(receiver, sender=LegalReasonRelatedObject)
+
+        self.assertEqual(deleted_related_objects, [related_object.pk])
+        self.assertFalse(LegalReason.objects.exists())
+
+
+class DatabaseAnonymizationTestCase(TestCase):
+
+    values = [None, '', 'Personal Tag', 'Mixed.Case@Example.COM', 'Příliš žluťoučký kůň', 'x' * 100]
+
+    @classmethod
+    def tearDownClass(cls):
+        register.anonymizers.pop(LegalReason, None)
+        super().tearDownClass()
+
+    def setUp(self):
+        if connection.vendor == 'sqlite':
+            # SQLite has no MD5 function, it is registered with the same result as PostgreSQL and MySQL MD5
+            connection.ensure_connection()
+            connection.connection.create_function(
+                'MD5', 1, lambda value: None if value is None else hashlib.md5(value.encode('utf-8')).hexdigest()
+            )
+            patcher = patch.object(MD5, 'supported_vendors', MD5.supported_vendors | {connection.vendor})
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _create_legal_reasons(self):
+        now = timezone.now()
+        content_type = ContentType.objects.get_for_model(LegalReason)
+        return [
+            LegalReason.objects.create(
+                purpose_slug='database-test', issued_at=now, expires_at=now + timedelta(days=1), tag=value,
+                source_object_content_type=content_type, source_object_id=str(LegalReason.objects.count())
+            )
+            for value in self.values
+        ]
+
+    def _get_tags(self, legal_reasons):
+        return list(LegalReason.objects.filter(pk__in=[obj.pk for obj in legal_reasons]).order_by('pk').values_list(
+            'tag', flat=True
+        ))
+
+    def assert_database_anonymization_equal(self, field_anonymizer):
+        legal_reasons = self._create_legal_reasons()
+        expression = field_anonymizer.get_db_expression(LegalReason._meta.get_field('tag'), connection)
+        self.assertIsNotNone(expression)
+        self.assertEqual(
+            list(LegalReason.objects.filter(pk__in=[legal_reason.pk for legal_reason in legal_reasons]).order_by(
+                'pk').annotate(anonymized_tag=expression).values_list('anonymized_tag', flat=True)),
+            field_anonymizer.get_anonymized_values_from_objs(legal_reasons, 'tag')
+        )
+
+    def test_md5_text_database_anonymization_should_be_equal_to_python_anonymization(self):
+        self.assert_database_anonymization_equal(MD5TextFieldAnonymizer())
+        self.assert_database_anonymization_equal(MD5TextFieldAnonymizer(empty_values=[None]))
+
+    def test_email_database_anonymization_should_be_equal_to_python_anonymization(self):
+        self.assert_database_anonymization_equal(EmailFieldAnonymizer())
+
+    def test_static_value_database_anonymization_should_be_equal_to_python_anonymization(self):
+        self.assert_database_anonymization_equal(StaticValueAnonymizer('static'))
+        self.assert_database_anonymization_equal(StaticValueAnonymizer('static', ignore_empty_values=False))
+
+    def test_anonymize_qs_should_store_same_values_as_anonymize_batch(self):
+        class LegalReasonTagAnonymizer(ModelAnonymizer):
+            tag = EmailFieldAnonymizer()
+
+            class Meta:
+                model = LegalReason
+
+        anonymizer = LegalReasonTagAnonymizer()
+        self.assertTrue(anonymizer.is_qs_anonymizable(connection))
+        sql_legal_reasons = self._create_legal_reasons()
+        python_legal_reasons = self._create_legal_reasons()
+
+        anonymizer.anonymize_qs(LegalReason.objects.filter(pk__in=[obj.pk for obj in sql_legal_reasons]))
+        anonymizer.anonymize_batch(list(anonymizer.get_rows(
+            LegalReason.objects.filter(pk__in=[obj.pk for obj in python_legal_reasons]).order_by('pk')
+        )))
+
+        self.assertNotEqual(self._get_tags(sql_legal_reasons), self.values)
+        self.assertEqual(self._get_tags(sql_legal_reasons), self._get_tags(python_legal_reasons))
+
+
+@override_settings(ANONYMIZATION_NAME_KEY='3141592653', ANONYMIZATION_PHONE_KEY=123456789,
+                   ANONYMIZATION_PERSONAL_ID_KEY=1234)
+class DeanonymizationTestCase(SimpleTestCase):
+
+    def test_phone_should_be_deanonymized_to_original_value(self):
+        anonymizer = PhoneFieldAnonymizer()
+        for value in ('+420000000000', '+420123456789', '+420876543210', '+420999999999'):
+            self.assertEqual(anonymizer.get_deanonymized_value(anonymizer.get_anonymized_value(value)), value)
+
+    def test_personal_id_should_be_deanonymized_to_one_of_originals(self):
+        anonymizer = PersonalIIDFieldAnonymizer()
+        originals = defaultdict(set)
+        for control_number in range(10000):
+            for digits in (3, 4):
+                if control_number < 10 ** digits:
+                    value = '800101{{0:0{}}}'.format(digits).format(control_number)
+                    originals[anonymizer.get_anonymized_value(value)].add(value)
+
+        for anonymized_value, values in originals.items():
+            self.assertIn(anonymizer.get_deanonymized_value(anonymized_value), values)
+        self.assertTrue({'8001010000', '8001019999'} <= originals['8001011234'])
+        self.assertEqual(anonymizer.get_deanonymized_value(anonymizer.get_anonymized_value('8001015000')),
+                         '8001015000')
+
+    def test_personal_id_deanonymization_should_reject_not_anonymized_value(self):
+        with self.assertRaises(ValueError):
+            PersonalIIDFieldAnonymizer().get_deanonymized_value('8001010000')
+
+    def test_name_should_be_deanonymized_to_normalized_original_value(self):
+        anonymizer = NameFieldAnonymizer()
+        for value, normalized_value in (('Jan', 'JAN'), ("O'Brien", 'OQBRIEN'), ('ZZZZZZZZZZZZ', 'ZZZZZZZZZZZZ'),
+                                        ('Žofie Nováčková-Dvořáková', 'ZOFIE NOVACKOVAQDVORAKOVA')):
+            self.assertEqual(anonymizer.get_deanonymized_value(anonymizer.get_anonymized_value(value)),
+                             normalized_value)
+
+    def test_not_reversible_anonymizer_should_not_be_deanonymized(self):
+        self.assertFalse(EmailFieldAnonymizer.is_reversible)
+        with self.assertRaises(NotImplementedError):
+            EmailFieldAnonymizer().get_deanonymized_value('0a1b2c3d@devnull.homecredit.net')
@@ -0,0 +1,62 @@
+from datetime import timedelta
+
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase
+from django.utils import timezone
+
+from gdpr.anonymizers import MD5TextFieldAnonymizer, ModelAnonymizer
+from gdpr.expiration import anonymize_expired_data
+from gdpr.loading import register
+from gdpr.models import AnonymizedData, LegalReason
+from gdpr.purposes.default import AbstractPurpose
+
+
+class ExpirationTestPurpose(AbstractPurpose):
+    name = 'Expiration test'
+    slug = 'expiration-test'
+    expiration_timedelta = timedelta(days=1)
+    fields = {'gdpr.LegalReason': ('tag',)}
+
+
+class AnonymizeExpiredDataTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        class LegalReasonTagAnonymizer(ModelAnonymizer):
+            tag = MD5TextFieldAnonymizer()
+
+            class Meta:
+                model = LegalReason
+
+        cls.obj_anonymizer = LegalReasonTagAnonymizer
+
+    @classmethod
+    def tearDownClass(cls):
+        register.anonymizers.pop(LegalReason, None)
+        super().tearDownClass()
+
+    def test_expired_fields_should_be_recorded_with_expired_reason(self):
+        self.assertFalse(self.obj_anonymizer.record_anonymized_data)
+        now = timezone.now()
+        content_type = ContentType.objects.get_for_model(LegalReason)
+        # Legal reason is used as the source object with the anonymized tag
+        source_object = LegalReason.objects.create(
+            purpose_slug='source', issued_at=now, expires_at=now + timedelta(days=1), tag='personal',
+            source_object_content_type=content_type, source_object_id='0'
+        )
+        expired_reason = LegalReason.objects.create(
+            purpose_slug=ExpirationTestPurpose.slug, issued_at=now - timedelta(days=2),
+            expires_at=now - timedelta(days=1), source_object_content_type=content_type,
+            source_object_id=str(source_object.pk)
+        )
+
+        self.assertEqual(anonymize_expired_data(now), 1)
+
+        self.assertEqual(LegalReason.objects.get(pk=source_object.pk).tag,
+                         MD5TextFieldAnonymizer().get_anonymized_value('personal'))
+        self.assertEqual(
+            list(AnonymizedData.objects.values_list('content_type', 'object_id', 'field', 'expired_reason')),
+            [(content_type.pk, str(source_object.pk), 'tag', expired_reason.pk)]
+        )
@@ -0,0 +1,46 @@
+import json
+
+from datetime import timedelta
+
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase
+from django.utils import timezone
+
+from gdpr.export import export_subject_json_lines, iterate_subject_rows
+from gdpr.models import AnonymizedData, LegalReason, LegalReasonRelatedObject
+
+
+class ExportSubjectTestCase(TestCase):
+
+    def setUp(self):
+        now = timezone.now()
+        self.source_object = ContentType.objects.get_for_model(AnonymizedData)
+        self.legal_reason = LegalReason.objects.create(
+            purpose_slug='export-test', issued_at=now, expires_at=now + timedelta(days=1),
+            source_object_content_type=ContentType.objects.get_for_model(ContentType),
+            source_object_id=str(self.source_object.pk)
+        )
+        self.related_objects = [
+            LegalReasonRelatedObject.objects.create(
+                legal_reason=self.legal_reason, object_content_type=ContentType.objects.get_for_model(LegalReason),
+                object_id=str(i)
+            )
+            for i in range(3)
+        ]
+
+    def test_export_should_contain_legal_reasons_and_their_related_objects(self):
+        exported_objects = [
+            (exported_object['model'], exported_object['pk'])
+            for exported_object in map(json.loads, ''.join(export_subject_json_lines(self.source_object)).splitlines())
+        ]
+
+        self.assertEqual(exported_objects, [
+            ('contenttypes.contenttype', self.source_object.pk),
+            ('gdpr.legalreason', self.legal_reason.pk),
+        ] + [('gdpr.legalreasonrelatedobject', related_object.pk) for related_object in self.related_objects])
+
+    def test_rows_should_be_loaded_in_batches_per_model(self):
+        self.assertEqual(
+            [(model, len(rows)) for model, field_names, rows in iterate_subject_rows(self.source_object, batch_size=2)],
+            [(ContentType, 1), (LegalReason, 1), (LegalReasonRelatedObject, 2), (LegalReasonRelatedObject, 1)]
+        )
@@ -0,0 +1,48 @@
+from django.db import connection
+from django.test import TestCase
+
+from gdpr.anonymizers import ModelAnonymizer
+from gdpr.loading import register
+from gdpr.metrics import ChunkMeasurement
+from gdpr.models import LegalReason
+
+
+class ChunkMeasurementTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        class LegalReasonAnonymizer(ModelAnonymizer):
+
+            class Meta:
+                model = LegalReason
+
+        cls.obj_anonymizer = LegalReasonAnonymizer
+
+    @classmethod
+    def tearDownClass(cls):
+        register.anonymizers.pop(LegalReason, None)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.anonymizer = self.obj_anonymizer()
+
+    def test_measurement_without_query_counting_should_not_force_debug_cursor(self):
+        with ChunkMeasurement(self.anonymizer, connection, count_queries=False) as measurement:
+            self.assertFalse(connection.force_debug_cursor)
+            LegalReason.objects.count()
+        data = measurement.get_data(0)
+        self.assertEqual(data['queries'], 0)
+        self.assertEqual(data['query_seconds'], 0.0)
+
+    def test_measurement_should_restore_connection_after_exception(self):
+        queries_log = connection.queries_log
+        with self.assertRaises(ValueError):
+            with ChunkMeasurement(self.anonymizer, connection) as measurement:
+                self.assertTrue(connection.force_debug_cursor)
+                LegalReason.objects.count()
+                raise ValueError
+        self.assertFalse(connection.force_debug_cursor)
+        self.assertIs(connection.queries_log, queries_log)
+        self.assertEqual(measurement.get_data(0)['queries'], 1)
@@ -0,0 +1,62 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase
+from django.utils import timezone
+
+from gdpr.models import AnonymizationCheckpoint, LegalReason, LegalReasonQuerySet
+from gdpr.purposes.default import AbstractPurpose
+
+
+class ConsentTestPurpose(AbstractPurpose):
+    name = 'Consent test'
+    slug = 'consent-test'
+    expiration_timedelta = timedelta(days=1)
+
+
+class CreateConsentsTestCase(TestCase):
+
+    def test_create_consents_should_retry_batch_with_concurrently_created_consent(self):
+        source_objects = list(ContentType.objects.order_by('pk')[:3])
+        concurrent_legal_reason = LegalReason.objects.create(
+            purpose_slug=ConsentTestPurpose.slug, issued_at=timezone.now(), expires_at=timezone.now(), is_active=False,
+            source_object_content_type=ContentType.objects.get_for_model(ContentType),
+            source_object_id=str(source_objects[0].pk)
+        )
+        select_for_update = LegalReasonQuerySet.select_for_update
+        selects = []
+
+        def concurrent_select_for_update(qs, *args, **kwargs):
+            selects.append(qs)
+            # The first select runs before the concurrent call commits its consent
+            return select_for_update(qs.none() if len(selects) == 1 else qs, *args, **kwargs)
+
+        with mock.patch.object(LegalReasonQuerySet, 'select_for_update', concurrent_select_for_update):
+            legal_reasons = LegalReason.objects.create_consents(ConsentTestPurpose.slug, source_objects, tag='retry')
+
+        self.assertEqual(len(selects), 2)
+        self.assertEqual(LegalReason.objects.count(), 3)
+        self.assertEqual(legal_reasons[0].pk, concurrent_legal_reason.pk)
+        self.assertEqual([legal_reason.source_object_id for legal_reason in legal_reasons],
+                         [str(source_object.pk) for source_object in source_objects])
+        self.assertTrue(all(
+            LegalReason.objects.exists_valid_consent(ConsentTestPurpose.slug, source_object)
+            for source_object in source_objects
+        ))
+        self.assertEqual(set(LegalReason.objects.values_list('tag', flat=True)), {'retry'})
+
+
+class AnonymizationCheckpointTestCase(TestCase):
+
+    def test_set_value_should_update_value_and_changed_at(self):
+        AnonymizationCheckpoint.objects.set_value('key', '1')
+        changed_at = timezone.now() - timedelta(days=1)
+        AnonymizationCheckpoint.objects.update(changed_at=changed_at)
+
+        AnonymizationCheckpoint.objects.set_value('key', '2')
+
+        checkpoint = AnonymizationCheckpoint.objects.get()
+        self.assertEqual(checkpoint.value, '2')
+        self.assertGreater(checkpoint.changed_at, changed_at)
+        self.assertEqual(AnonymizationCheckpoint.objects.get_value('key'), '2')
@@ -0,0 +1,130 @@
+from datetime import timedelta
+
+from django.contrib.contenttypes.models import ContentType
+from django.test import SimpleTestCase, TestCase
+from django.utils import timezone
+
+from gdpr.anonymizers import DeleteModelAnonymizer, MD5TextFieldAnonymizer, ModelAnonymizer, StaticValueAnonymizer
+from gdpr.loading import register
+from gdpr.models import AnonymizationCheckpoint, AnonymizedData, LegalReason, LegalReasonRelatedObject
+from gdpr.scheduling import AnonymizationSchedule, get_topological_order
+
+
+class TopologicalOrderTestCase(SimpleTestCase):
+
+    def test_parents_should_precede_children(self):
+        self.assertEqual(
+            get_topological_order(['child', 'parent', 'root'],
+                                  {'child': {'parent'}, 'parent': {'root'}, 'root': set()}),
+            ['root', 'parent', 'child']
+        )
+
+    def test_cycles_should_be_resolved_in_order_of_models(self):
+        self.assertEqual(
+            get_topological_order(['first', 'second', 'child'],
+                                  {'first': {'second'}, 'second': {'first'}, 'child': {'first'}}),
+            ['first', 'second', 'child']
+        )
+
+
+class AnonymizationScheduleTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        class LegalReasonAnonymizer(ModelAnonymizer):
+            tag = MD5TextFieldAnonymizer()
+
+            class Meta:
+                model = LegalReason
+
+        class LegalReasonDeleteAnonymizer(DeleteModelAnonymizer):
+
+            class Meta:
+                model = LegalReason
+
+        class LegalReasonRelatedObjectAnonymizer(ModelAnonymizer):
+            object_id = StaticValueAnonymizer('0')
+
+            class Meta:
+                model = LegalReasonRelatedObject
+
+        class LegalReasonRelatedObjectDeleteAnonymizer(DeleteModelAnonymizer):
+
+            class Meta:
+                model = LegalReasonRelatedObject
+
+        class AnonymizedDataAnonymizer(ModelAnonymizer):
+            field = StaticValueAnonymizer('field')
+
+            class Meta:
+                model = AnonymizedData
+
+        class AnonymizationCheckpointAnonymizer(ModelAnonymizer):
+            value = StaticValueAnonymizer('')
+
+            class Meta:
+                model = AnonymizationCheckpoint
+
+        cls.legal_reason_anonymizer = LegalReasonAnonymizer
+        cls.legal_reason_delete_anonymizer = LegalReasonDeleteAnonymizer
+        cls.related_object_anonymizer = LegalReasonRelatedObjectAnonymizer
+        cls.related_object_delete_anonymizer = LegalReasonRelatedObjectDeleteAnonymizer
+        cls.anonymized_data_anonymizer = AnonymizedDataAnonymizer
+        cls.checkpoint_anonymizer = AnonymizationCheckpointAnonymizer
+
+    @classmethod
+    def tearDownClass(cls):
+        for model in (LegalReason, LegalReasonRelatedObject, AnonymizedData, AnonymizationCheckpoint):
+            register.anonymizers.pop(model, None)
+        super().tearDownClass()
+
+    def test_referenced_models_should_be_parents(self):
+        schedule = AnonymizationSchedule([
+            self.related_object_anonymizer, self.legal_reason_anonymizer, self.checkpoint_anonymizer
+        ])
+
+        self.assertEqual(schedule.parents[LegalReasonRelatedObject], {LegalReason})
+        self.assertEqual(schedule.parents[LegalReason], set())
+        self.assertEqual(schedule.parents[AnonymizationCheckpoint], set())
+
+    def test_independent_models_should_form_components_anonymized_in_same_stages(self):
+        schedule = AnonymizationSchedule([
+            self.related_object_anonymizer, self.legal_reason_anonymizer, self.checkpoint_anonymizer
+        ])
+
+        self.assertEqual(schedule.get_components(), [
+            [self.legal_reason_anonymizer, self.related_object_anonymizer],
+            [self.checkpoint_anonymizer],
+        ])
+        self.assertEqual(schedule.get_stages(), [
+            [self.legal_reason_anonymizer, self.checkpoint_anonymizer],
+            [self.related_object_anonymizer],
+        ])
+
+    def test_deletes_should_be_scheduled_child_first_before_updates(self):
+        schedule = AnonymizationSchedule([
+            self.legal_reason_delete_anonymizer, self.anonymized_data_anonymizer, self.related_object_delete_anonymizer
+        ])
+
+        self.assertEqual(schedule.get_ordered_anonymizers(), [
+            self.related_object_delete_anonymizer, self.legal_reason_delete_anonymizer, self.anonymized_data_anonymizer
+        ])
+
+    def test_rows_deleted_by_cascade_should_be_excluded(self):
+        now = timezone.now()
+        content_type = ContentType.objects.get_for_model(LegalReason)
+        legal_reason = LegalReason.objects.create(
+            purpose_slug='schedule-test', issued_at=now, expires_at=now + timedelta(days=1),
+            source_object_content_type=content_type, source_object_id='1'
+        )
+        kept_anonymized_data = AnonymizedData.objects.create(field='tag', content_type=content_type, object_id='1')
+        AnonymizedData.objects.create(field='tag', content_type=content_type, object_id='1',
+                                      expired_reason=legal_reason)
+        schedule = AnonymizationSchedule([self.legal_reason_delete_anonymizer, self.anonymized_data_anonymizer])
+
+        self.assertIs(schedule.get_model_filter(LegalReason), False)
+        self.assertIsNone(schedule.get_filter(self.legal_reason_delete_anonymizer))
+        self.assertIsNone(schedule.get_model_filter(AnonymizationCheckpoint))
+        self.assertEqual(list(schedule.get_queryset(self.anonymized_data_anonymizer)), [kept_anonymized_data])
@@ -0,0 +1,76 @@
+from datetime import timedelta
+
+from django.contrib.contenttypes.models import ContentType
+from django.test import TestCase
+from django.utils import timezone
+
+from gdpr.anonymizers import MD5TextFieldAnonymizer, ModelAnonymizer
+from gdpr.loading import register
+from gdpr.models import AnonymizationCheckpoint, AnonymizedData, LegalReason, LegalReasonRelatedObject
+from gdpr.subject import forget_subject, get_subject_object_ids
+
+
+class SubjectObjectsTestCase(TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+
+        class LegalReasonTagAnonymizer(ModelAnonymizer):
+            tag = MD5TextFieldAnonymizer()
+
+            class Meta:
+                model = LegalReason
+
+    @classmethod
+    def tearDownClass(cls):
+        register.anonymizers.pop(LegalReason, None)
+        super().tearDownClass()
+
+    def _create_legal_reason(self, source_object, related_object):
+        legal_reason = LegalReason.objects.create(
+            purpose_slug='subject-test', issued_at=self.now, expires_at=self.now + timedelta(days=1),
+            source_object_content_type=ContentType.objects.get_for_model(source_object),
+            source_object_id=str(source_object.pk)
+        )
+        LegalReasonRelatedObject.objects.create(
+            legal_reason=legal_reason, object_content_type=ContentType.objects.get_for_model(related_object),
+            object_id=str(related_object.pk)
+        )
+
+    def setUp(self):
+        self.now = timezone.now()
+        # Content types are used as source objects of two subjects and as the related object shared by both of them,
+        # legal reasons reference them with source_object_content_type foreign key
+        self.subject_a = ContentType.objects.get_for_model(AnonymizedData)
+        self.subject_b = ContentType.objects.get_for_model(LegalReasonRelatedObject)
+        self.shared_object = ContentType.objects.get_for_model(AnonymizationCheckpoint)
+        self._create_legal_reason(self.subject_a, self.shared_object)
+        self._create_legal_reason(self.subject_b, self.shared_object)
+        # Object that references the subject A and object of the subject B that references the shared object
+        self.owned_object_a = LegalReason.objects.create(
+            purpose_slug='subject-test', issued_at=self.now, expires_at=self.now + timedelta(days=1), tag='a',
+            source_object_content_type=self.subject_a, source_object_id='0'
+        )
+        self.referencing_object_b = LegalReason.objects.create(
+            purpose_slug='subject-test', issued_at=self.now, expires_at=self.now + timedelta(days=1), tag='b',
+            source_object_content_type=self.shared_object, source_object_id=str(self.subject_b.pk)
+        )
+
+    def test_objects_referencing_shared_related_object_should_not_belong_to_subject(self):
+        object_ids = get_subject_object_ids(self.subject_a)
+
+        self.assertEqual(object_ids[ContentType], {self.subject_a.pk, self.shared_object.pk})
+        self.assertEqual(object_ids[LegalReason], {self.owned_object_a.pk})
+
+    def test_objects_referencing_related_object_should_belong_to_subject_if_followed(self):
+        object_ids = get_subject_object_ids(self.subject_a, follow_related_objects=True)
+
+        self.assertEqual(object_ids[LegalReason], {self.owned_object_a.pk, self.referencing_object_b.pk})
+
+    def test_forget_subject_should_not_anonymize_other_subject_objects(self):
+        forget_subject(self.subject_a, keep_legal_reasons=True)
+
+        self.assertEqual(LegalReason.objects.get(pk=self.owned_object_a.pk).tag,
+                         MD5TextFieldAnonymizer().get_anonymized_value('a'))
+        self.assertEqual(LegalReason.objects.get(pk=self.referencing_object_b.pk).tag, 'b')
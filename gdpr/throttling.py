@@ -0,0 +1,172 @@
+import time
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.module_loading import import_string
+
+
+class AdaptiveChunkSize:
+    """
+    Chunk size that is adjusted after every chunk toward the target chunk latency according to the measured rows per
+    second. Change of one step is limited by max_factor therefore one outlier chunk cannot change the size too much.
+    """
+
+    def __init__(self, initial_size, target_seconds=1.0, min_size=100, max_size=100000, max_factor=2.0):
+        """
+        Args:
+            initial_size: chunk size of the first chunk
+            target_seconds: target wall time of one chunk
+            min_size: minimal chunk size
+            max_size: maximal chunk size
+            max_factor: maximal ratio of two consecutive chunk sizes
+        """
+        self.target_seconds = target_seconds
+        self.min_size = min_size
+        self.max_size = max_size
+        self.max_factor = max_factor
+        self.size = self._clamp(initial_size)
+
+    def _clamp(self, size):
+        return int(min(max(size, self.min_size), self.max_size))
+
+    def __call__(self):
+        return self.size
+
+    def update(self, rows, seconds):
+        """
+        Adjust chunk size according to the measured chunk.
+
+        Args:
+            rows: number of rows of the chunk
+            seconds: wall time of the chunk
+
+        Returns:
+            new chunk size
+        """
+        if rows and seconds > 0:
+            size = rows / seconds * self.target_seconds
+            self.size = self._clamp(min(max(size, self.size / self.max_factor), self.size * self.max_factor))
+        return self.size
+
+
+class ReplicaLagProbe:
+    """
+    Probe returns current replication lag in seconds or None if the lag is not known.
+    """
+
+    def get_lag(self):
+        raise NotImplementedError
+
+
+class PostgreSQLReplicaLagProbe(ReplicaLagProbe):
+    """
+    Returns the greatest replay lag of the replicas connected to the PostgreSQL (10+) primary database.
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        """
+        Args:
+            using: alias of the primary database
+        """
+        self.using = using
+
+    def get_lag(self):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute('SELECT EXTRACT(EPOCH FROM MAX(replay_lag)) FROM pg_stat_replication')
+            lag = cursor.fetchone()[0]
+        return None if lag is None else float(lag)
+
+
+class MySQLReplicaLagProbe(ReplicaLagProbe):
+    """
+    Returns Seconds_Behind_Master of the MySQL replica database.
+    """
+
+    def __init__(self, using=DEFAULT_DB_ALIAS):
+        """
+        Args:
+            using: alias of the replica database (usually configured in the GDPR_REPLICA_LAG_PROBE_OPTIONS setting)
+        """
+        self.using = using
+
+    def get_lag(self):
+        with connections[self.using].cursor() as cursor:
+            cursor.execute('SHOW SLAVE STATUS')
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            lag = dict(zip((column[0] for column in cursor.description), row)).get('Seconds_Behind_Master')
+        return None if lag is None else float(lag)
+
+
+def get_replica_lag_probe():
+    """
+    Returns:
+        replica lag probe configured with settings GDPR_REPLICA_LAG_PROBE (import path of the probe class) and
+        GDPR_REPLICA_LAG_PROBE_OPTIONS (probe init kwargs) or None if the probe is not configured
+    """
+    probe_path = getattr(settings, 'GDPR_REPLICA_LAG_PROBE', None)
+    if probe_path is None:
+        return None
+    return import_string(probe_path)(**getattr(settings, 'GDPR_REPLICA_LAG_PROBE_OPTIONS', {}))
+
+
+class Throttle:
+    """
+    Throttle pauses anonymization between chunks when the database is overloaded: the average statement time of the
+    last chunk or the replication lag exceeds its threshold. Pause is doubled (up to max_backoff_seconds) while the
+    database stays overloaded and it is reset after the first chunk without overload.
+    """
+
+    def __init__(self, max_statement_seconds=None, max_replica_lag=None, replica_lag_probe=None, backoff_seconds=1.0,
+                 max_backoff_seconds=60.0):
+        """
+        Args:
+            max_statement_seconds: threshold of the average SQL statement time of the chunk
+            max_replica_lag: threshold of the replication lag in seconds, it is measured with replica_lag_probe
+            replica_lag_probe: ReplicaLagProbe instance, the probe configured in settings is used by default
+            backoff_seconds: first pause
+            max_backoff_seconds: maximal pause
+        """
+        self.max_statement_seconds = max_statement_seconds
+        self.max_replica_lag = max_replica_lag
+        self.replica_lag_probe = (
+            replica_lag_probe if replica_lag_probe is not None or max_replica_lag is None else get_replica_lag_probe()
+        )
+        self.backoff_seconds = backoff_seconds
+        self.max_backoff_seconds = max_backoff_seconds
+        self.throttled_seconds = 0.0
+        self._current_backoff_seconds = backoff_seconds
+
+    def is_overloaded(self, statement_seconds=None):
+        if (self.max_statement_seconds is not None and statement_seconds is not None and
+                statement_seconds > self.max_statement_seconds):
+            return True
+        if self.max_replica_lag is not None and self.replica_lag_probe is not None:
+            lag = self.replica_lag_probe.get_lag()
+            return lag is not None and lag > self.max_replica_lag
+        return False
+
+    def wait(self, queries=0, query_seconds=0.0):
+        """
+        Pause while the database is overloaded. Statement time is measured only by the chunk therefore after the first
+        pause only the replication lag is checked.
+
+        Args:
+            queries: number of SQL statements of the last chunk
+            query_seconds: time of SQL statements of the last chunk
+
+        Returns:
+            number of seconds of the pause
+        """
+        statement_seconds = query_seconds / queries if queries else None
+        waited_seconds = 0.0
+        while self.is_overloaded(statement_seconds):
+            time.sleep(self._current_backoff_seconds)
+            waited_seconds += self._current_backoff_seconds
+            self._current_backoff_seconds = min(self._current_backoff_seconds * 2, self.max_backoff_seconds)
+            statement_seconds = None
+        if not waited_seconds:
+            self._current_backoff_seconds = self.backoff_seconds
+        self.throttled_seconds += waited_seconds
+        return waited_seconds
@@ -22,7 +22,7 @@ setup(
         'Programming Language :: Python',
     ],
     install_requires=[
-        'django>=1.10',
+        'django>=1.11',
         'django-chamber>=0.4.0',
     ],
     zip_safe=False